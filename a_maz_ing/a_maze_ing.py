@@ -1,28 +1,83 @@
 #!/usr/bin/env python3
 import curses
 import random
+import sys
 import time
+from array import array
+
+# Wall bits of a cell, in the order of Cell.walls: North, East, South, West
+NORTH, EAST, SOUTH, WEST = 1, 2, 4, 8
+BITS = (NORTH, EAST, SOUTH, WEST)
+ALL_WALLS = NORTH | EAST | SOUTH | WEST
+
+
+class Walls:
+    """
+    The four walls of a cell as a list of booleans (view on the maze bytes)
+    """
+
+    def __init__(self, maze, index: int):
+        self.maze = maze
+        self.index = index
+
+    def __getitem__(self, side: int) -> bool:
+        return bool(self.maze.walls[self.index] & BITS[side])
+
+    def __setitem__(self, side: int, value: bool):
+        if value:
+            self.maze.walls[self.index] |= BITS[side]
+        else:
+            self.maze.walls[self.index] &= ~BITS[side]
+
+    def __len__(self):
+        return 4
+
+    def __iter__(self):
+        return (self[side] for side in range(4))
+
+    def __repr__(self):
+        return repr(list(self))
+
 
 class Cell:
     """
     Characteristic of a cell position and wall situation
+
+    A cell is only a view: walls and visited live in the Maze arrays,
+    so a cell can be created and dropped at any time.
     """
     WALL = "█"
     EMPTY = " "
     ENTRANCE = "*"
     OUT = "E"
-    
-    def __init__(self, x: int, y: int):
+
+    def __init__(self, x: int, y: int, maze=None):
         self.x = x
         self.y = y
-        self.visited = False
-        self.walls = [True, True, True, True]
-    
+        self.maze = maze if maze is not None else Maze(1, 1)
+        self.index = y * maze.width + x if maze is not None else 0
+        self.walls = Walls(self.maze, self.index)
+
+    def __eq__(self, other):
+        return isinstance(other, Cell) and self.maze is other.maze \
+            and self.index == other.index
+
+    def __hash__(self):
+        return self.index
+
+    @property
+    def visited(self) -> bool:
+        return self.maze.is_visited(self.index)
+
+    @visited.setter
+    def visited(self, value: bool):
+        self.maze.set_visited(self.index, value)
+
     def draw(self, stdscr):
         """Draws the cell at its position."""
         sy = self.y * 2
         sx = self.x * 4
-        
+
         # Top wall
         if self.walls[0]:  # North
             stdscr.addstr(sy, sx, self.WALL * 4)
@@ -30,13 +85,13 @@ class Cell:
             stdscr.addstr(sy, sx, self.WALL)
             stdscr.addstr(sy, sx + 1, self.EMPTY * 2)
             stdscr.addstr(sy, sx + 3, self.WALL)
-        
+
         # Right wall
         if self.walls[1]:  # East
             stdscr.addstr(sy + 1, sx + 3, self.WALL)
         else:
             stdscr.addstr(sy + 1, sx + 3, self.EMPTY)
-        
+
         # Bottom wall
         if self.walls[2]:  # South
             stdscr.addstr(sy + 2, sx, self.WALL * 4)
@@ -44,139 +99,406 @@ class Cell:
             stdscr.addstr(sy + 2, sx, self.WALL)
             stdscr.addstr(sy + 2, sx + 1, self.EMPTY * 2)
             stdscr.addstr(sy + 2, sx + 3, self.WALL)
-        
+
         # Left wall
         if self.walls[3]:  # West
             stdscr.addstr(sy + 1, sx, self.WALL)
         else:
             stdscr.addstr(sy + 1, sx, self.EMPTY)
-        
+
         # Interior space
-        if self.visited:
-            stdscr.addstr(sy + 1, sx + 1, self.EMPTY * 2)
-        else:
-            stdscr.addstr(sy + 1, sx + 1, self.EMPTY * 2)
-    
-    def get_neighbors(self, grid, rows, cols):
-        neighbors = []
-        
-        # Check top neighbor (North)
-        if self.y - 1 >= 0:
-            top = grid[self.y - 1][self.x]
-            if not top.visited:
-                neighbors.append(top)
-        
-        # Check right neighbor (East)
-        if self.x + 1 < cols:
-            rig = grid[self.y][self.x + 1]
-            if not rig.visited:
-                neighbors.append(rig)
-        
-        # Check bottom neighbor (South)
-        if self.y + 1 < rows:
-            bot = grid[self.y + 1][self.x]
-            if not bot.visited:
-                neighbors.append(bot)
-        
-        # Check left neighbor (West)
-        if self.x - 1 >= 0:
-            lef = grid[self.y][self.x - 1]
-            if not lef.visited:
-                neighbors.append(lef)
-        
-        return neighbors
+        stdscr.addstr(sy + 1, sx + 1, self.EMPTY * 2)
+
+    def get_neighbors(self, grid=None, rows=None, cols=None):
+        """Unvisited neighbors (North, East, South, West order)"""
+        maze = self.maze
+        return [maze.cell(i % maze.width, i // maze.width)
+                for i in maze.unvisited_neighbors(self.index)]
+
+
+class Row:
+    """
+    One row of the maze as a sequence of cells
+    """
+
+    def __init__(self, maze, y: int):
+        self.maze = maze
+        self.y = y
+
+    def __len__(self):
+        return self.maze.width
+
+    def __getitem__(self, x: int) -> Cell:
+        if x < 0:
+            x += self.maze.width
+        if not 0 <= x < self.maze.width:
+            raise IndexError(x)
+        return Cell(x, self.y, self.maze)
+
+    def __iter__(self):
+        return (Cell(x, self.y, self.maze) for x in range(self.maze.width))
+
+
+class Grid:
+    """
+    grid[y][x] access to the cells, like the old list of lists
+    """
+
+    def __init__(self, maze):
+        self.maze = maze
+
+    def __len__(self):
+        return self.maze.height
+
+    def __getitem__(self, y: int) -> Row:
+        if y < 0:
+            y += self.maze.height
+        if not 0 <= y < self.maze.height:
+            raise IndexError(y)
+        return Row(self.maze, y)
+
+    def __iter__(self):
+        return (Row(self.maze, y) for y in range(self.maze.height))
 
 
 class Maze:
-    
+    """
+    Walls packed as 4 bits per cell (one byte, NORTH | EAST | SOUTH | WEST)
+    and visited cells in a bitset. Cell index = y * width + x.
+    4000x4000 is 16 MB of walls and 2 MB of visited bits.
+    """
+
     def __init__(self, width, height):
         self.width = width
         self.height = height
+        self.size = width * height
+        self.walls = bytearray([ALL_WALLS]) * self.size
+        self.visited = bytearray((self.size + 7) >> 3)
         self.grid = self.create_grid()
-    
+
     def create_grid(self):
-        """Creates a grid of cells with given width and height."""
-        return [[Cell(x, y) for x in range(self.width)] for y in range(self.height)]
-    
+        """Cells view of the packed grid (grid[y][x] is a Cell)"""
+        return Grid(self)
+
+    def cell(self, x: int, y: int) -> Cell:
+        return Cell(x, y, self)
+
+    def is_visited(self, index: int) -> bool:
+        return bool(self.visited[index >> 3] & (1 << (index & 7)))
+
+    def set_visited(self, index: int, value: bool = True):
+        if value:
+            self.visited[index >> 3] |= 1 << (index & 7)
+        else:
+            self.visited[index >> 3] &= ~(1 << (index & 7))
+
+    def neighbors(self, index: int):
+        """(side, neighbor index) of the cells around index"""
+        w = self.width
+        x = index % w
+        out = []
+        if index >= w:
+            out.append((0, index - w))
+        if x + 1 < w:
+            out.append((1, index + 1))
+        if index + w < self.size:
+            out.append((2, index + w))
+        if x:
+            out.append((3, index - 1))
+        return out
+
+    def unvisited_neighbors(self, index: int):
+        return [n for _, n in self.neighbors(index)
+                if not self.is_visited(n)]
+
+    def carve(self, a: int, b: int):
+        """Open the wall between two adjacent cells"""
+        w = self.width
+        if b == a - w:
+            side = 0
+        elif b == a + 1 and b % w:
+            side = 1
+        elif b == a + w:
+            side = 2
+        elif b == a - 1 and a % w:
+            side = 3
+        else:
+            raise ValueError(f"cells {a} and {b} are not adjacent")
+        self.walls[a] &= ~BITS[side]
+        self.walls[b] &= ~BITS[(side + 2) % 4]
+
     def remove_walls(self, cell_a, cell_b):
-        diff = cell_a.x - cell_b.x
-        if diff == 1:
-            cell_a.walls[3] = False
-            cell_b.walls[1] = False
-        elif diff == -1:
-            cell_b.walls[3] = False
-            cell_a.walls[1] = False
-        
-        diff = cell_a.y - cell_b.y
-        if diff == 1:
-            cell_a.walls[0] = False
-            cell_b.walls[2] = False
-        elif diff == -1:
-            cell_b.walls[0] = False
-            cell_a.walls[2] = False
-    
-    def generate(self, stdscr, animate=True):
-        """Generate maze using recursive backtracking"""
-        current = self.grid[0][0]
-        current.visited = True
-        stack = [current]
-        if animate:
-            self.draw_grid(stdscr)
+        self.carve(cell_a.index, cell_b.index)
+
+    def reset(self):
+        """Every wall up, nothing visited"""
+        self.walls[:] = bytearray([ALL_WALLS]) * self.size
+        self.visited[:] = bytes(len(self.visited))
+
+    def padded(self):
+        """Copy of the walls with a border of 0 cells around the grid
+        (row stride width + 2): a cell next to the border never needs a
+        bounds check, the border looks like visited cells."""
+        stride = self.width + 2
+        cells = bytearray(stride * (self.height + 2))
+        for y in range(self.height):
+            start = (y + 1) * stride + 1
+            cells[start:start + self.width] = \
+                self.walls[y * self.width:(y + 1) * self.width]
+        return cells
+
+    def unpad(self, cells):
+        """Write back the walls of a padded() copy"""
+        stride = self.width + 2
+        for y in range(self.height):
+            start = (y + 1) * stride + 1
+            self.walls[y * self.width:(y + 1) * self.width] = \
+                cells[start:start + self.width]
+
+    def visit_all(self):
+        self.visited[:] = b'\xff' * len(self.visited)
+        if self.size & 7:
+            self.visited[-1] = (1 << (self.size & 7)) - 1
+
+    def generate(self, stdscr=None, animate=True, seed=None, start=0,
+                 algorithm="backtracker", delay=0.05, fps=30):
+        """Generate maze with one of the generators.GENERATORS
+        (recursive backtracking by default). The same seed gives the
+        same maze.
+
+        Animated, only the cells a step touched are redrawn, at most
+        fps frames a second (see Renderer); delay is a pause per step,
+        0 runs the generator at full speed.
+        """
+        from generators import GENERATORS
+        if algorithm not in GENERATORS:
+            raise ValueError(f"Unknown algorithm {algorithm!r}, choose in "
+                             + ", ".join(sorted(GENERATORS)))
+        on_carve = None
+        if animate and stdscr is not None:
+            self.renderer = Renderer(stdscr, self, fps, delay)
+            self.renderer.draw_all()
             time.sleep(0.3)
-        
-        while stack:
-            neighbors = current.get_neighbors(self.grid, self.height, self.width)
-            
-            if neighbors:
-                nextt = random.choice(neighbors)
-                nextt.visited = True
-                self.remove_walls(current, nextt)
-                
-                stack.append(current)
+            on_carve = self.renderer.on_carve
+        GENERATORS[algorithm](self, random.Random(seed), on_carve, start)
+        if on_carve:
+            self.renderer.flush()
+        self.visit_all()
+
+    def backtrack(self, rng, start=0, on_carve=None):
+        """Recursive backtracking, iterative on cell indices
+
+        Runs over a padded() copy of the walls: a cell with its 4 walls
+        up is a cell not visited yet, the stack is an array of uint32
+        and nothing is allocated per step.
+        """
+        rand = rng.random
+        w = self.width
+        stride = w + 2
+        cells = self.padded()
+        delta = (-stride, 1, stride, -1)
+        keep = tuple(ALL_WALLS ^ bit for bit in BITS)
+        back = keep[2:] + keep[:2]
+        cand = [0, 0, 0, 0]
+        stack = array('I')
+        push, pop = stack.append, stack.pop
+        current = (start // w + 1) * stride + start % w + 1
+
+        while True:
+            k = 0
+            if cells[current - stride] == ALL_WALLS:
+                cand[0] = 0
+                k = 1
+            if cells[current + 1] == ALL_WALLS:
+                cand[k] = 1
+                k += 1
+            if cells[current + stride] == ALL_WALLS:
+                cand[k] = 2
+                k += 1
+            if cells[current - 1] == ALL_WALLS:
+                cand[k] = 3
+                k += 1
+
+            if k:
+                side = cand[int(rand() * k)]
+                nextt = current + delta[side]
+                cells[current] &= keep[side]
+                cells[nextt] &= back[side]
+                if on_carve:
+                    a = (current // stride - 1) * w + current % stride - 1
+                    b = (nextt // stride - 1) * w + nextt % stride - 1
+                    self.walls[a] = cells[current]
+                    self.walls[b] = cells[nextt]
+                    on_carve(a, b)
+                push(current)
                 current = nextt
-                
-                if animate:
-                    self.draw_grid(stdscr)
-                    time.sleep(0.05)
+            elif stack:
+                current = pop()
             else:
-                current = stack.pop()
-    
+                break
+        self.unpad(cells)
+
     def draw_grid(self, stdscr):
         """Draws the entire grid by calling each cell's draw method."""
-        stdscr.clear()
-        for row in self.grid:
-            for cell in row:
-                cell.draw(stdscr)
-        stdscr.refresh()
+        Renderer(stdscr, self).draw_all()
+
+
+class Renderer:
+    """
+    Curses view of a maze that only redraws the cells that changed
+
+    Changed cells are collected in a dirty set. A frame draws them with
+    noutrefresh and a single doupdate, and there is at most one frame
+    per 1 / fps seconds: when the generator is faster than the
+    terminal, frames are skipped and their cells go in the next one.
+    Cells outside the terminal are never drawn.
+    """
+
+    def __init__(self, stdscr, maze, fps=30, delay=0.0):
+        self.stdscr = stdscr
+        self.maze = maze
+        self.budget = 1 / fps if fps else 0
+        self.delay = delay
+        self.dirty = set()
+        self.next_frame = 0.0
+        self.frames = 0
+        self.skipped = 0
+        rows, cols = stdscr.getmaxyx()
+        # a cell takes 3 lines x 4 columns, the last line is for messages
+        self.cols = min(maze.width, cols // 4)
+        self.rows = min(maze.height, (rows - 2) // 2)
+
+    def draw_cell(self, index: int):
+        x, y = index % self.maze.width, index // self.maze.width
+        if x < self.cols and y < self.rows:
+            Cell(x, y, self.maze).draw(self.stdscr)
+
+    def draw_all(self):
+        """Full redraw (first frame, resize)"""
+        self.stdscr.erase()
+        w = self.maze.width
+        for y in range(self.rows):
+            for x in range(self.cols):
+                self.draw_cell(y * w + x)
+        self.dirty.clear()
+        self.show()
+
+    def flush(self):
+        """Draw the dirty cells now"""
+        for index in self.dirty:
+            self.draw_cell(index)
+        self.dirty.clear()
+        self.show()
+
+    def show(self):
+        self.stdscr.noutrefresh()
+        curses.doupdate()
+        self.frames += 1
+        self.next_frame = time.perf_counter() + self.budget
+
+    def overlay(self, path):
+        """Paint a solver path (cell indices) over the maze: the cells,
+        the openings between them, ENTRANCE and OUT. Only the path is
+        drawn, erase() puts its cells back."""
+        if not path:
+            return
+        w, scr = self.maze.width, self.stdscr
+        color = curses.color_pair(1)
+        for i, index in enumerate(path):
+            x, y = index % w, index // w
+            if x >= self.cols or y >= self.rows:
+                continue
+            sy, sx = y * 2, x * 4
+            scr.addstr(sy + 1, sx + 1, Cell.EMPTY * 2, color)
+            nxt = path[i + 1] if i + 1 < len(path) else index
+            if nxt == index + 1 and x + 1 < self.cols:
+                scr.addstr(sy + 1, sx + 3, Cell.EMPTY, color)
+            elif nxt == index - 1:
+                scr.addstr(sy + 1, sx, Cell.EMPTY, color)
+            elif nxt == index + w and y + 1 < self.rows:
+                scr.addstr(sy + 2, sx + 1, Cell.EMPTY * 2, color)
+            elif nxt == index - w:
+                scr.addstr(sy, sx + 1, Cell.EMPTY * 2, color)
+        for index, mark in ((path[0], Cell.ENTRANCE), (path[-1], Cell.OUT)):
+            x, y = index % w, index // w
+            if x < self.cols and y < self.rows:
+                scr.addstr(y * 2 + 1, x * 4 + 1, mark * 2, color)
+        self.show()
+
+    def erase(self, path):
+        """Redraw the cells under a path painted by overlay()"""
+        self.dirty.update(path)
+        self.flush()
+
+    def on_carve(self, a: int, b: int):
+        """Generator hook: cells a and b changed"""
+        self.dirty.add(a)
+        self.dirty.add(b)
+        if time.perf_counter() >= self.next_frame:
+            self.flush()
+        else:
+            self.skipped += 1
+        if self.delay:
+            time.sleep(self.delay)
 
 
 def main(stdscr):
     """Main function to set up curses and display the grid."""
     curses.curs_set(0)  # Hide cursor
-    
+
     # Initialize color pairs
     curses.start_color()
     curses.init_pair(1, curses.COLOR_BLACK, curses.COLOR_MAGENTA)
-    
-    # Define grid dimensions
-    width, height = 20, 15
-    
+
+    # Define grid dimensions, algorithm from the command line
+    args = sys.argv[1:]
+    algorithm = args[0] if args else "backtracker"
+    width, height = map(int, args[1:3]) if len(args) > 2 else (20, 15)
+    line = min(height * 2 + 3, stdscr.getmaxyx()[0] - 1)
+
     # Create maze
     maze = Maze(width, height)
-    
+
     # Show initial grid
     maze.draw_grid(stdscr)
-    stdscr.addstr(height * 2 + 3, 0, "Press any key to generate maze...")
-    stdscr.getch()
-    
-    # Generate maze with animation
-    maze.generate(stdscr, animate=True)
-    
-    # Show completed maze
-    maze.draw_grid(stdscr)
-    stdscr.addstr(height * 2 + 3, 0, "Press any key to exit")
+    stdscr.addstr(line, 0, "Press any key to generate maze...")
     stdscr.getch()
 
+    # Generate maze with animation (no pause per step on big mazes)
+    maze.generate(stdscr, animate=True, algorithm=algorithm,
+                  delay=0.05 if maze.size <= 1000 else 0)
+
+    # Show completed maze, then solve it on demand
+    from solvers import solve
+    keys = {ord("b"): "bfs", ord("a"): "astar", ord("d"): "bidirectional",
+            ord("f"): "dead_end_filling"}
+    message = (f"{maze.renderer.frames} frames"
+               f" ({maze.renderer.skipped} skipped).")
+    shown = None
+    while True:
+        stdscr.move(line, 0)
+        stdscr.clrtoeol()
+        text = (message + " Solve: b bfs, a A*, d bidirectional,"
+                " f dead-end filling. Other key to exit")
+        stdscr.addstr(line, 0, text[:stdscr.getmaxyx()[1] - 1])
+        key = stdscr.getch()
+        if key not in keys:
+            break
+        if shown is not None:
+            maze.renderer.erase(shown.path)
+        shown = solve(maze, keys[key])
+        if shown.path:
+            maze.renderer.overlay(shown.path)
+        message = (f"{shown.name}: path {shown.length},"
+                   f" explored {shown.explored},"
+                   f" {shown.seconds * 1000:.1f} ms.")
+
 
 if __name__ == "__main__":
+    from generators import GENERATORS
+    if len(sys.argv) > 1 and sys.argv[1] not in GENERATORS \
+            or len(sys.argv) == 3 or len(sys.argv) > 4 \
+            or not all(arg.isdigit() and int(arg) for arg in sys.argv[2:]):
+        sys.exit("Usage: a_maze_ing.py ["
+                 + "|".join(sorted(GENERATORS)) + "] [width height]")
     curses.wrapper(main)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Maze generators on the packed Maze grid (see a_maze_ing.py)
+
+A generator is a function (maze, rng, on_carve=None, start=0) that opens
+walls of a fresh maze with the random.Random it is given, so a seed
+always gives the same maze. on_carve(a, b) is called after each opened
+wall between the cells a and b when the maze is animated.
+"""
+import argparse
+import random
+import sys
+import time
+from array import array
+
+from a_maze_ing import ALL_WALLS, BITS, EAST, NORTH, SOUTH, WEST, Maze
+
+GENERATORS = {}
+
+KEEP = tuple(ALL_WALLS ^ bit for bit in BITS)
+BACK = KEEP[2:] + KEEP[:2]
+HEX = bytes.maketrans(bytes(range(16)), b"0123456789ABCDEF")
+
+
+def register(name):
+    """Add a generator to GENERATORS under name"""
+    def wrap(func):
+        GENERATORS[name] = func
+        return func
+    return wrap
+
+
+def step(w, side):
+    """Index offset of the neighbor on a side"""
+    return (-w, 1, w, -1)[side]
+
+
+@register("backtracker")
+def backtracker(maze, rng, on_carve=None, start=0):
+    """Recursive backtracking: long corridors, few dead ends"""
+    maze.backtrack(rng, start, on_carve)
+
+
+@register("kruskal")
+def kruskal(maze, rng, on_carve=None, start=0):
+    """Open the walls in random order when they join two sets
+    (union-find with path halving)"""
+    w, n, walls = maze.width, maze.size, maze.walls
+    # wall 2 * i is east of cell i, wall 2 * i + 1 is south of it
+    edges = [2 * i for i in range(n) if (i + 1) % w]
+    edges += range(1, 2 * (n - w), 2)
+    rng.shuffle(edges)
+    parent = array('I', range(n))
+    left = n - 1
+    for e in edges:
+        if not left:
+            break
+        a = e >> 1
+        b = a + w if e & 1 else a + 1
+        ra = a
+        while parent[ra] != ra:
+            parent[ra] = parent[parent[ra]]
+            ra = parent[ra]
+        rb = b
+        while parent[rb] != rb:
+            parent[rb] = parent[parent[rb]]
+            rb = parent[rb]
+        if ra == rb:
+            continue
+        parent[ra] = rb
+        left -= 1
+        if e & 1:
+            walls[a] &= ~SOUTH
+            walls[b] &= ~NORTH
+        else:
+            walls[a] &= ~EAST
+            walls[b] &= ~WEST
+        if on_carve:
+            on_carve(a, b)
+
+
+@register("prim")
+def prim(maze, rng, on_carve=None, start=0):
+    """Grow from start: join a random frontier cell to the maze"""
+    w, n, walls = maze.width, maze.size, maze.walls
+    rand = rng.random
+    state = bytearray(n)  # 0 outside, 1 frontier, 2 in the maze
+    frontier = []
+    cand = [0, 0, 0, 0]
+    cell = start
+    while True:
+        state[cell] = 2
+        x = cell % w
+        k = 0
+        for side, ok in ((0, cell >= w), (1, x + 1 < w),
+                         (2, cell + w < n), (3, x > 0)):
+            if not ok:
+                continue
+            nb = cell + step(w, side)
+            if state[nb] == 0:
+                state[nb] = 1
+                frontier.append(nb)
+            elif state[nb] == 2:
+                cand[k] = side
+                k += 1
+        if k:
+            side = cand[int(rand() * k)]
+            nb = cell + step(w, side)
+            walls[cell] &= KEEP[side]
+            walls[nb] &= BACK[side]
+            if on_carve:
+                on_carve(cell, nb)
+        if not frontier:
+            break
+        j = int(rand() * len(frontier))
+        cell = frontier[j]
+        frontier[j] = frontier[-1]
+        frontier.pop()
+
+
+@register("wilson")
+def wilson(maze, rng, on_carve=None, start=0):
+    """Loop-erased random walks: every spanning tree is equally likely"""
+    w, n, walls = maze.width, maze.size, maze.walls
+    rand = rng.random
+    inside = bytearray(n)
+    inside[start] = 1
+    way = bytearray(n)  # last side taken when leaving a cell
+    for first in range(n):
+        if inside[first]:
+            continue
+        cell = first
+        while not inside[cell]:
+            x = cell % w
+            while True:
+                side = int(rand() * 4)
+                if (side == 0 and cell >= w) or (side == 1 and x + 1 < w) \
+                        or (side == 2 and cell + w < n) \
+                        or (side == 3 and x):
+                    break
+            way[cell] = side
+            cell += step(w, side)
+        cell = first
+        while not inside[cell]:
+            side = way[cell]
+            nb = cell + step(w, side)
+            walls[cell] &= KEEP[side]
+            walls[nb] &= BACK[side]
+            inside[cell] = 1
+            if on_carve:
+                on_carve(cell, nb)
+            cell = nb
+
+
+def eller_rows(width, height, rng):
+    """Eller's algorithm: yield the walls of each row (bytearray) while
+    keeping only the current row and its sets, O(width) memory"""
+    rand = rng.random
+    sets = list(range(width))
+    members = {i: [i] for i in range(width)}
+    fresh = width
+    row = bytearray([ALL_WALLS]) * width
+    for y in range(height):
+        last = y == height - 1
+        for x in range(width - 1):
+            a, b = sets[x], sets[x + 1]
+            if a == b or not (last or rand() < 0.5):
+                continue
+            row[x] &= ~EAST
+            row[x + 1] &= ~WEST
+            if len(members[a]) < len(members[b]):
+                a, b = b, a
+            for c in members[b]:
+                sets[c] = a
+            members[a].extend(members.pop(b))
+        if last:
+            yield row
+            return
+        below = bytearray([ALL_WALLS]) * width
+        next_sets = [-1] * width
+        next_members = {}
+        for key, cols in members.items():
+            down = [c for c in cols if rand() < 0.5]
+            if not down:
+                down = [cols[int(rand() * len(cols))]]
+            for c in down:
+                row[c] &= ~SOUTH
+                below[c] &= ~NORTH
+                next_sets[c] = key
+            next_members[key] = down
+        for c in range(width):
+            if next_sets[c] < 0:
+                next_sets[c] = fresh
+                next_members[fresh] = [c]
+                fresh += 1
+        yield row
+        row, sets, members = below, next_sets, next_members
+
+
+@register("eller")
+def eller(maze, rng, on_carve=None, start=0):
+    """Eller's algorithm, one row at a time (see eller_rows)"""
+    w = maze.width
+    for y, row in enumerate(eller_rows(w, maze.height, rng)):
+        maze.walls[y * w:(y + 1) * w] = row
+        if on_carve:
+            for i in range(y * w, (y + 1) * w):
+                on_carve(i, i)
+
+
+@register("binary_tree")
+def binary_tree(maze, rng, on_carve=None, start=0):
+    """Every cell opens north or east: a straight north row and east
+    column, biased toward the north-east corner"""
+    w, n, walls = maze.width, maze.size, maze.walls
+    rand = rng.random
+    for cell in range(n):
+        north, east = cell >= w, (cell + 1) % w != 0
+        if north and east:
+            side = 0 if rand() < 0.5 else 1
+        elif north or east:
+            side = 0 if north else 1
+        else:
+            continue
+        nb = cell + step(w, side)
+        walls[cell] &= KEEP[side]
+        walls[nb] &= BACK[side]
+        if on_carve:
+            on_carve(cell, nb)
+
+
+@register("sidewinder")
+def sidewinder(maze, rng, on_carve=None, start=0):
+    """Runs of east openings, each run opens north from one of its cells"""
+    w, h, walls = maze.width, maze.height, maze.walls
+    rand = rng.random
+    for y in range(h):
+        run = y * w
+        for cell in range(y * w, (y + 1) * w):
+            last = cell + 1 == (y + 1) * w
+            if y and (last or rand() < 0.5):
+                up = run + int(rand() * (cell - run + 1))
+                walls[up] &= ~NORTH
+                walls[up - w] &= ~SOUTH
+                run = cell + 1
+                if on_carve:
+                    on_carve(up, up - w)
+            elif not last:
+                walls[cell] &= ~EAST
+                walls[cell + 1] &= ~WEST
+                if on_carve:
+                    on_carve(cell, cell + 1)
+
+
+def write_hex(rows, out):
+    """One line of hex digits per row (wall bits of each cell)"""
+    for row in rows:
+        out.write(row.translate(HEX) + b"\n")
+
+
+def bench(names, width, height, seed=42):
+    """Seconds and cells/sec of each generator on a width x height maze"""
+    print(f"{width}x{height} ({width * height} cells), seed {seed}")
+    print(f"{'algorithm':<12} {'seconds':>9} {'cells/s':>12}")
+    for name in names:
+        maze = Maze(width, height)
+        t = time.perf_counter()
+        GENERATORS[name](maze, random.Random(seed))
+        t = time.perf_counter() - t
+        print(f"{name:<12} {t:>9.3f} {maze.size / t:>12,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split("\n")[0])
+    parser.add_argument("algorithm", nargs="?", default="backtracker",
+                        choices=sorted(GENERATORS))
+    parser.add_argument("width", nargs="?", type=int, default=20)
+    parser.add_argument("height", nargs="?", type=int, default=15)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("-o", "--output", help="hex walls file (- stdout)")
+    parser.add_argument("--stream", action="store_true",
+                        help="eller only: write rows without the full grid")
+    parser.add_argument("--bench", nargs=2, type=int,
+                        metavar=("WIDTH", "HEIGHT"),
+                        help="compare the cells/sec of every algorithm")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(sorted(GENERATORS), *args.bench,
+              42 if args.seed is None else args.seed)
+        return
+    t = time.perf_counter()
+    if args.stream:
+        if args.algorithm != "eller":
+            sys.exit("--stream needs the eller algorithm")
+        rows = eller_rows(args.width, args.height, random.Random(args.seed))
+    else:
+        maze = Maze(args.width, args.height)
+        GENERATORS[args.algorithm](maze, random.Random(args.seed))
+        rows = (maze.walls[y * maze.width:(y + 1) * maze.width]
+                for y in range(maze.height))
+    if args.output in (None, "-"):
+        write_hex(rows, sys.stdout.buffer)
+    else:
+        with open(args.output, "wb") as out:
+            write_hex(rows, out)
+    print(f"{args.width * args.height} cells in "
+          f"{time.perf_counter() - t:.3f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Maze solvers on the packed Maze grid (see a_maze_ing.py)
+
+A solver is a function (maze, start, end) returning (path, explored):
+the cell indices from start to end (empty if end cannot be reached) and
+the number of cells it expanded. solve() times it. The border walls are
+never opened, so the neighbors of a cell need no bounds check.
+"""
+import argparse
+import heapq
+import re
+import sys
+import time
+from array import array
+
+from a_maze_ing import BITS, EAST, NORTH, SOUTH, WEST, Maze
+from generators import GENERATORS
+
+SOLVERS = {}
+
+# sides without a wall, for each value of a cell's wall byte
+OPEN_SIDES = tuple(tuple(side for side in range(4) if not walls & BITS[side])
+                   for walls in range(16))
+# number of open sides for each value of a cell's wall byte
+DEGREE = bytes(len(sides) for sides in OPEN_SIDES).ljust(256, b"\0")
+HEX_DIGITS = b"0123456789ABCDEFabcdef"
+UNHEX = bytes.maketrans(HEX_DIGITS, bytes(range(16)) + bytes(range(10, 16)))
+
+
+def register(name):
+    """Add a solver to SOLVERS under name"""
+    def wrap(func):
+        SOLVERS[name] = func
+        return func
+    return wrap
+
+
+class Solution:
+    """
+    Path found by a solver and what it cost
+    """
+
+    def __init__(self, name, path, explored, seconds):
+        self.name = name
+        self.path = path
+        self.explored = explored
+        self.seconds = seconds
+
+    @property
+    def length(self):
+        """Cells on the path, start and end included (0: no path)"""
+        return len(self.path)
+
+    def __str__(self):
+        return (f"{self.name:<17} {self.length:>10} {self.explored:>10}"
+                f" {self.seconds:>9.3f}")
+
+
+def trace(parent, start, end):
+    """Path from start to end following the parent links back"""
+    path = array('I', [end])
+    while end != start:
+        end = parent[end]
+        path.append(end)
+    path.reverse()
+    return path
+
+
+@register("bfs")
+def bfs(maze, start, end, skip=None):
+    """Breadth-first search, shortest path (skip: cells to ignore)"""
+    w, walls = maze.width, maze.walls
+    delta = (-w, 1, w, -1)
+    parent = array('i', [-1]) * maze.size
+    parent[start] = start
+    queue = array('I', [start])
+    head = 0
+    while head < len(queue):
+        cell = queue[head]
+        head += 1
+        if cell == end:
+            return trace(parent, start, end), head
+        for side in OPEN_SIDES[walls[cell]]:
+            nb = cell + delta[side]
+            if parent[nb] < 0 and not (skip and skip[nb]):
+                parent[nb] = cell
+                queue.append(nb)
+    return array('I'), head
+
+
+@register("astar")
+def astar(maze, start, end):
+    """A* with the Manhattan distance, deepest node first on ties"""
+    w, walls = maze.width, maze.walls
+    delta = (-w, 1, w, -1)
+    ex, ey = end % w, end // w
+    parent = array('i', [-1]) * maze.size
+    cost = array('i', [-1]) * maze.size
+    parent[start] = start
+    cost[start] = 0
+    heap = [(abs(start % w - ex) + abs(start // w - ey), 0, start)]
+    explored = 0
+    while heap:
+        _, g, cell = heapq.heappop(heap)
+        if -g != cost[cell]:
+            continue
+        explored += 1
+        if cell == end:
+            return trace(parent, start, end), explored
+        g = cost[cell] + 1
+        for side in OPEN_SIDES[walls[cell]]:
+            nb = cell + delta[side]
+            if cost[nb] < 0 or g < cost[nb]:
+                cost[nb] = g
+                parent[nb] = cell
+                h = abs(nb % w - ex) + abs(nb // w - ey)
+                heapq.heappush(heap, (g + h, -g, nb))
+    return array('I'), explored
+
+
+@register("bidirectional")
+def bidirectional(maze, start, end):
+    """Two breadth-first searches, the smaller frontier grows first"""
+    if start == end:
+        return array('I', [start]), 1
+    w, walls = maze.width, maze.walls
+    delta = (-w, 1, w, -1)
+    parent = array('i', [-1]) * maze.size
+    side_of = bytearray(maze.size)  # 1 seen from start, 2 from end
+    parent[start], parent[end] = start, end
+    side_of[start], side_of[end] = 1, 2
+    fronts = {1: [start], 2: [end]}
+    explored = 0
+    while fronts[1] and fronts[2]:
+        me = 1 if len(fronts[1]) <= len(fronts[2]) else 2
+        grown = []
+        for cell in fronts[me]:
+            explored += 1
+            for side in OPEN_SIDES[walls[cell]]:
+                nb = cell + delta[side]
+                if not side_of[nb]:
+                    side_of[nb] = me
+                    parent[nb] = cell
+                    grown.append(nb)
+                elif side_of[nb] != me:
+                    a, b = (cell, nb) if me == 1 else (nb, cell)
+                    path = trace(parent, start, a)
+                    back = trace(parent, end, b)
+                    back.reverse()
+                    return path + back, explored
+        fronts[me] = grown
+    return array('I'), explored
+
+
+@register("dead_end_filling")
+def dead_end_filling(maze, start, end):
+    """Fill every dead end until only the path is left, then walk it
+    (a breadth-first search over the cells not filled)"""
+    walls = maze.walls
+    delta = (-maze.width, 1, maze.width, -1)
+    degree = bytearray(walls.translate(DEGREE))
+    filled = bytearray(maze.size)
+    ends = (start, end)
+    stack = array('I', (m.start() for m in re.finditer(b"[\x00\x01]", degree)
+                        if m.start() not in ends))
+    explored = 0
+    while stack:
+        cell = stack.pop()
+        if filled[cell]:
+            continue
+        filled[cell] = 1
+        explored += 1
+        for side in OPEN_SIDES[walls[cell]]:
+            nb = cell + delta[side]
+            if not filled[nb]:
+                degree[nb] -= 1
+                if degree[nb] == 1 and nb not in ends:
+                    stack.append(nb)
+    path, walked = bfs(maze, start, end, filled)
+    return path, explored + walked
+
+
+def solve(maze, name="bfs", start=0, end=None):
+    """Run a solver from start to end (default: last cell) and time it"""
+    if name not in SOLVERS:
+        raise ValueError(f"Unknown solver {name!r}, choose in "
+                         + ", ".join(sorted(SOLVERS)))
+    end = maze.size - 1 if end is None else end
+    t = time.perf_counter()
+    path, explored = SOLVERS[name](maze, start, end)
+    return Solution(name, path, explored, time.perf_counter() - t)
+
+
+def load_hex(path):
+    """Maze from a file of hex wall digits, one line per row
+    (generators.py -o)"""
+    with open(path, "rb") as f:
+        lines = f.read().split()
+    maze = Maze(len(lines[0]) if lines else 0, len(lines))
+    for y, line in enumerate(lines):
+        if len(line) != maze.width or line.translate(None, HEX_DIGITS):
+            raise ValueError(f"{path}: line {y + 1} is not "
+                             f"{maze.width} hex digits")
+        line = line.translate(UNHEX)
+        if not line[0] & WEST or not line[-1] & EAST \
+                or y == 0 and not all(v & NORTH for v in line) \
+                or y == len(lines) - 1 and not all(v & SOUTH for v in line):
+            raise ValueError(f"{path}: line {y + 1} opens the border")
+        maze.walls[y * maze.width:(y + 1) * maze.width] = line
+    maze.visit_all()
+    return maze
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split("\n")[0])
+    parser.add_argument("width", nargs="?", type=int, default=1000)
+    parser.add_argument("height", nargs="?", type=int, default=1000)
+    parser.add_argument("-a", "--algorithm", default="backtracker",
+                        choices=sorted(GENERATORS),
+                        help="generator of the maze")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-i", "--input", help="hex maze file to solve")
+    parser.add_argument("-s", "--solver", action="append",
+                        choices=sorted(SOLVERS),
+                        help="solver to run (default: all of them)")
+    args = parser.parse_args()
+
+    t = time.perf_counter()
+    if args.input:
+        try:
+            maze = load_hex(args.input)
+        except (OSError, ValueError) as e:
+            sys.exit(str(e))
+    else:
+        maze = Maze(args.width, args.height)
+        maze.generate(None, seed=args.seed, algorithm=args.algorithm)
+    print(f"{maze.width}x{maze.height} ({maze.size} cells) ready in "
+          f"{time.perf_counter() - t:.3f} s")
+    print(f"{'solver':<17} {'path':>10} {'explored':>10} {'seconds':>9}")
+    lengths = set()
+    for name in args.solver or sorted(SOLVERS):
+        solution = solve(maze, name)
+        lengths.add(solution.length)
+        print(solution)
+    if 0 in lengths:
+        sys.exit("No path from the entrance to the exit")
+
+
+if __name__ == "__main__":
+    main()
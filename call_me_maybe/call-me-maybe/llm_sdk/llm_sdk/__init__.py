@@ -1,11 +1,12 @@
 # ABOUTME: LLM SDK for local model inference using Hugging Face transformers.
 # ABOUTME: Provides Small_LLM_Model class for loading and running causal language models.
 
+import copy
 import time
 from typing import Tuple
 
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, PreTrainedTokenizer, PreTrainedModel, logging
+from transformers import AutoModelForCausalLM, AutoTokenizer, Cache, DynamicCache, PreTrainedTokenizer, PreTrainedModel, logging
 from huggingface_hub import hf_hub_download
 import os
 
@@ -13,6 +14,63 @@ import os
 logging.set_verbosity_error()  # keep the console clean
 
 
+def _left_pad(t: torch.Tensor, width: int, dim: int) -> torch.Tensor:
+    """Prepend zeros to *t* along *dim* up to *width*."""
+    missing = width - t.shape[dim]
+    if missing <= 0:
+        return t
+    shape = list(t.shape)
+    shape[dim] = missing
+    return torch.cat([t.new_zeros(shape), t], dim=dim)
+
+
+class KVBatch:
+    """Key/value caches of several sequences decoded together by :py:meth:`Small_LLM_Model.get_batch_next_logits`.
+
+    The sequences are left-padded to a common length, so they all end on the last column and a step appends
+    one column for every row. ``mask`` marks the real tokens (1) and the padding (0) that attention skips.
+    """
+
+    def __init__(self) -> None:
+        self.layers: list[tuple[torch.Tensor, torch.Tensor]] = []
+        self.mask: torch.Tensor | None = None
+
+
+    def __len__(self) -> int:
+        return 0 if self.mask is None else self.mask.shape[0]
+
+
+    def add(self, past: Cache) -> None:
+        """Append a sequence as the last row, from the cache of its prefill (see :py:meth:`Small_LLM_Model.pop_cache`)."""
+        layers = [(layer.keys, layer.values) for layer in past.layers]
+        keys = layers[0][0]
+        row_mask = torch.ones(1, keys.shape[-2], dtype=torch.long, device=keys.device)
+        if self.mask is None:
+            self.layers, self.mask = layers, row_mask
+            return
+        width = max(self.mask.shape[1], row_mask.shape[1])
+        self.layers = [
+            (torch.cat([_left_pad(k, width, -2), _left_pad(nk, width, -2)]),
+             torch.cat([_left_pad(v, width, -2), _left_pad(nv, width, -2)]))
+            for (k, v), (nk, nv) in zip(self.layers, layers)
+        ]
+        self.mask = torch.cat([_left_pad(self.mask, width, -1), _left_pad(row_mask, width, -1)])
+
+
+    def keep(self, rows: list[int]) -> None:
+        """Drop every row not in *rows*, and the padding columns no row needs anymore."""
+        if self.mask is None:
+            return
+        if not rows:
+            self.layers, self.mask = [], None
+            return
+        index = torch.tensor(rows, dtype=torch.long, device=self.mask.device)
+        mask = self.mask[index]
+        start = int(mask.any(dim=0).long().argmax())  # first column holding a real token
+        self.mask = mask[:, start:]
+        self.layers = [(k[index, :, start:], v[index, :, start:]) for k, v in self.layers]
+
+
 class Small_LLM_Model:
     """Utility class wrapping a lightweight Hugging Face causal-LM for fast, low-memory experimentation.
 
@@ -73,6 +131,9 @@ class Small_LLM_Model:
         for p in self._model.parameters():
             p.requires_grad = False
 
+        # key/value cache of the sequence fed to get_next_logits()
+        self._past: Cache | None = None
+
 
     def encode(self, text: str) -> torch.Tensor:
         """Tokenise *text* and return a 2-D ``input_ids`` tensor on the target device."""
@@ -99,6 +160,108 @@ class Small_LLM_Model:
         return [float(x) for x in logits]
 
 
+    def reset_cache(self) -> None:
+        """Drop the key/value cache: the next :py:meth:`get_next_logits` call starts a new sequence."""
+        self._past = None
+
+
+    @property
+    def cached_length(self) -> int:
+        """Number of tokens held in the key/value cache."""
+        return 0 if self._past is None else self._past.get_seq_length()
+
+
+    @property
+    def model_name(self) -> str:
+        """Identifier of the loaded model on the HF Hub."""
+        return self._model_name
+
+
+    def snapshot_cache(self) -> Cache | None:
+        """Copy of the key/value cache, e.g. after a prompt prefix shared by many sequences."""
+        return copy.deepcopy(self._past)
+
+
+    def restore_cache(self, snapshot: Cache | None) -> None:
+        """Continue from a :py:meth:`snapshot_cache` result.
+
+        The snapshot is copied, so it stays intact and can be restored again for the next sequence.
+        """
+        self._past = copy.deepcopy(snapshot)
+
+
+    def get_next_logits(self, new_ids: list[int]) -> torch.Tensor:
+        """Feed the tokens that follow the cached ones and return the raw logits for the next token.
+
+        Unlike :py:meth:`get_logits_from_input_ids`, the attention keys and values of the
+        tokens seen so far are kept between calls, so a generation step runs the model on
+        the new token only instead of the whole sequence.
+
+        Parameters
+        ----------
+        new_ids: list[int]
+            Token ids appended since the previous call (the full prompt after
+            :py:meth:`reset_cache`).
+
+        Returns
+        -------
+        torch.Tensor
+            1-D ``float32`` tensor on the CPU; ``.numpy()`` gives an array sharing its memory.
+        """
+        if not new_ids:
+            raise ValueError("get_next_logits() needs at least one new token id")
+        input_tensor = torch.tensor([new_ids], device=self._device, dtype=torch.long)
+        with torch.no_grad():
+            out = self._model(
+                input_ids=input_tensor,
+                past_key_values=self._past,
+                use_cache=True,
+                logits_to_keep=1,  # skip the vocabulary projection of the other positions
+            )
+        self._past = out.past_key_values
+        return out.logits[0, -1].float().cpu()
+
+
+    def pop_cache(self) -> Cache | None:
+        """Hand over the key/value cache (e.g. to :py:meth:`KVBatch.add`) and start from an empty one."""
+        past, self._past = self._past, None
+        return past
+
+
+    def get_batch_next_logits(self, batch: KVBatch, new_ids: list[int]) -> torch.Tensor:
+        """Feed one new token to every sequence of *batch* in a single forward pass.
+
+        Parameters
+        ----------
+        batch: KVBatch
+            Sequences decoded together; their caches are extended in place.
+        new_ids: list[int]
+            Next token id of each row, in row order.
+
+        Returns
+        -------
+        torch.Tensor
+            2-D ``float32`` CPU tensor of raw logits, one row per sequence.
+        """
+        if batch.mask is None or len(new_ids) != len(batch):
+            raise ValueError("get_batch_next_logits() needs one new token id per row of a non-empty batch")
+        input_tensor = torch.tensor(new_ids, device=self._device, dtype=torch.long)[:, None]
+        # a row's new token comes after its real tokens only, padding has no position
+        positions = batch.mask.sum(dim=1, keepdim=True)
+        mask = torch.cat([batch.mask, torch.ones_like(positions)], dim=1)
+        with torch.no_grad():
+            out = self._model(
+                input_ids=input_tensor,
+                attention_mask=mask,
+                position_ids=positions,
+                past_key_values=DynamicCache(ddp_cache_data=batch.layers),
+                use_cache=True,
+            )
+        batch.layers = [(layer.keys, layer.values) for layer in out.past_key_values.layers]
+        batch.mask = mask
+        return out.logits[:, -1].float().cpu()
+
+
     def get_path_to_vocab_file(self) -> str:
         vocab_file_name = self._tokenizer.vocab_files_names.get('vocab_file', "vocab.json")
         vocab_path = hf_hub_download(
@@ -0,0 +1,108 @@
+"""Continuous batching: one forward pass per step for several prompts."""
+from collections import deque
+
+import numpy as np
+from llm_sdk import KVBatch, Small_LLM_Model
+
+from .constrainDecoder import NEG_INF, ConstrainedDecoder
+from .prefixCache import PrefixCache
+from .schemaMachine import State
+
+
+class Slot:
+    """A prompt decoded in a row of the batch"""
+
+    def __init__(self, index: int, state: State | None) -> None:
+        self.index = index
+        self.state = state
+        self.generated = ''
+        self.steps = 0
+
+
+class BatchEngine:
+    """Greedy constrained decoding of the prompts, batch_size at a time
+    (1: one prompt after the other).
+
+    A prompt is prefilled alone (from the prefix cache when given) and
+    its kv cache joins the batch; then every step runs the last token
+    of all the rows at once. A finished row leaves the batch and the
+    next prompt of the queue takes its place, so the batch stays full
+    until the queue runs out.
+    """
+
+    def __init__(
+        self,
+        model: Small_LLM_Model,
+        decoder: ConstrainedDecoder,
+        prefix: PrefixCache | None = None,
+        batch_size: int = 4,
+        max_tokens: int = 100
+    ) -> None:
+        if batch_size < 1:
+            raise ValueError(f'batch size must be at least 1: {batch_size}')
+        self.model = model
+        self.decoder = decoder
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+
+    def _prefill(self, ids: list[int]) -> np.ndarray:
+        """Logits of the first token, the prompt left in the model cache"""
+        logits: np.ndarray
+        if self.prefix is not None:
+            logits = self.prefix.prefill(self.decoder.functions, ids)
+        else:
+            self.model.reset_cache()
+            logits = self.model.get_next_logits(ids).numpy()
+        return logits
+
+    def run(self, prompts: list[list[int]]) -> list[str]:
+        """Generate the output of every prompt.
+
+        Args:
+            prompts: token ids of each prompt
+
+        Returns:
+            generated text of each prompt, in the same order
+        """
+        queue = deque(enumerate(prompts))
+        results = [''] * len(prompts)
+        batch = KVBatch()
+        slots: list[Slot] = []
+        rows: list[np.ndarray] = []
+
+        while slots or queue:
+            while queue and len(slots) < self.batch_size:
+                index, ids = queue.popleft()
+                rows.append(self._prefill(ids))
+                batch.add(self.model.pop_cache())
+                slots.append(Slot(index, self.decoder.machine.start))
+
+            masked = self.decoder.mask_batch(
+                np.stack(rows), [slot.state for slot in slots])
+            keep: list[int] = []
+            next_ids: list[int] = []
+            for row, slot in enumerate(slots):
+                if np.all(masked[row] == NEG_INF):
+                    print(f'BN: all token masked (prompt {slot.index})')
+                else:
+                    next_id = int(np.argmax(masked[row]))
+                    next_str = self.decoder.id_to_clean.get(next_id, '')
+                    slot.generated += next_str
+                    slot.state = self.decoder.machine.run(
+                        next_str, slot.state)
+                    slot.steps += 1
+                    if not slot.generated.endswith("}}") \
+                            and slot.steps < self.max_tokens:
+                        keep.append(row)
+                        next_ids.append(next_id)
+                        continue
+                results[slot.index] = slot.generated
+
+            batch.keep(keep)
+            slots = [slots[row] for row in keep]
+            rows = []
+            if slots:
+                logits = self.model.get_batch_next_logits(batch, next_ids)
+                rows = list(logits.numpy())
+        return results
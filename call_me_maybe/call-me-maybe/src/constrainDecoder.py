@@ -1,13 +1,13 @@
 """Main part constrain decoding"""
 """Constrained decoding — forces valid JSON output."""
 import json
+from collections import OrderedDict
 import numpy as np
 from .funcDef import FuncDef
+from .schemaMachine import SchemaMachine, State
+from .tokenTrie import TokenTrie
 
 NEG_INF = float('-inf')
-FIXED_START = '{"name": "'
-FIXED_MIDDLE = '", "parameters": {'
-FIXED_END = '}}'
 
 
 def _clean(token: str) -> str:
@@ -15,14 +15,54 @@ def _clean(token: str) -> str:
     return token.replace('Ġ', ' ').replace('Ċ', '\n')
 
 
+class MaskCache:
+    """Token masks of the machine states, packed 8 tokens per byte.
+
+    A state is the lexical position in the schema: ('fn', f, seg, sub)
+    is function f, segment seg (a parameter name or value) and position
+    sub in it, so every step inside a string value or a number hits the
+    same entry. The least recently used mask goes first when full.
+    """
+
+    def __init__(self, size: int, max_entries: int = 256) -> None:
+        self.size = size
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._packed: OrderedDict[State, np.ndarray] = OrderedDict()
+
+    def get(self, state: State) -> np.ndarray | None:
+        """Mask of state, None when not cached"""
+        packed = self._packed.get(state)
+        if packed is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._packed.move_to_end(state)
+        mask: np.ndarray = np.unpackbits(packed, count=self.size).view(bool)
+        return mask
+
+    def put(self, state: State, mask: np.ndarray) -> None:
+        """Store the mask of state, evicting the oldest if full"""
+        self._packed[state] = np.packbits(mask)
+        self._packed.move_to_end(state)
+        while len(self._packed) > self.max_entries:
+            self._packed.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._packed)
+
+
 class ConstrainedDecoder:
     """Forces output to match: {"name": "fn_x", "parameters": {"p": v}}"""
 
     def __init__(
         self,
         functions: list[FuncDef],
-        vocab_path: str
+        vocab_path: str,
+        cache_size: int = 256
     ) -> None:
+        self.functions = functions
         self.fn_map: dict[str, FuncDef] = {
             fn.name: fn for fn in functions
         }
@@ -35,28 +75,86 @@ class ConstrainedDecoder:
             v: _clean(k) for k, v in token_to_id.items()
         }
 
+        self.machine = SchemaMachine(functions)
+        self.trie = TokenTrie(self.id_to_clean)
+        self.cache = MaskCache(self.trie.size, cache_size)
+        self._text = ''
+        self._state: State | None = self.machine.start
+
+    def state_of(self, generated: str) -> State | None:
+        """Machine state after generated (None: not a valid prefix).
+        Continues from the last call when generated extends it."""
+        if not generated.startswith(self._text):
+            self._text, self._state = '', self.machine.start
+        if self._state is not None:
+            self._state = self.machine.run(
+                generated[len(self._text):], self._state)
+        self._text = generated
+        return self._state
+
+    def token_mask(self, generated: str) -> np.ndarray:
+        """Tokens that keep the output valid after generated.
+
+        Returns:
+            boolean array indexed by token id
+        """
+        return self.state_mask(self.state_of(generated))
+
+    def state_mask(self, state: State | None) -> np.ndarray:
+        """Tokens that keep the output valid from a machine state.
+
+        Returns:
+            boolean array indexed by token id
+        """
+        if state is None:
+            return np.zeros(self.trie.size, dtype=bool)
+        allowed = self.cache.get(state)
+        if allowed is None:
+            allowed = self.trie.allowed(self.machine, state)
+            self.cache.put(state, allowed)
+        return allowed
+
     def mask_logits(
         self,
-        logits: list[float],
+        logits: list[float] | np.ndarray,
         generated: str
     ) -> np.ndarray:
         """Set invalid token logits to -inf.
 
         Args:
-            logits: raw logits from get_logits_from_input_ids().
+            logits: raw logits from get_next_logits().
             generated: text generated so far after Output:.
 
         Returns:
             masked logits array.
         """
-        masked = np.full(len(logits), NEG_INF, dtype=np.float32)
+        values = np.asarray(logits, dtype=np.float32)
+        allowed = self.token_mask(generated)
+        keep = np.zeros(len(values), dtype=bool)
+        n = min(len(values), len(allowed))
+        keep[:n] = allowed[:n]
+        return np.where(keep, values, np.float32(NEG_INF))
+
+    def mask_batch(
+        self,
+        logits: np.ndarray,
+        states: list[State | None]
+    ) -> np.ndarray:
+        """mask_logits() for a batch, each row with its own state.
 
-        for tid, tstr in self.id_to_clean.items():
-            if tid < len(logits) and tstr:
-                if self._is_valid(generated, tstr):
-                    masked[tid] = logits[tid]
+        Args:
+            logits: raw logits, one row per sequence.
+            states: machine state of each sequence.
 
-        return masked
+        Returns:
+            masked logits array.
+        """
+        values = np.asarray(logits, dtype=np.float32)
+        keep = np.zeros(values.shape, dtype=bool)
+        n = min(values.shape[1], self.trie.size)
+        for row, state in enumerate(states):
+            keep[row, :n] = self.state_mask(state)[:n]
+        return np.where(keep, values, np.float32(NEG_INF))
 
     def _is_valid(self, generated: str, token: str) -> bool:
         """Check if appending token keeps the output valid."""
@@ -64,88 +162,4 @@ class ConstrainedDecoder:
 
     def _is_valid_prefix(self, candidate: str) -> bool:
         """Check if candidate is a valid prefix of some complete output."""
-
-        # phase 1: fixed start '{"name": "'
-        n = min(len(candidate), len(FIXED_START))
-        if candidate[:n] != FIXED_START[:n]:
-            return False
-        if len(candidate) <= len(FIXED_START):
-            return True
-
-        after_start = candidate[len(FIXED_START):]
-
-        # phase 2: function name — LLM picks, we constrain to valid names
-        q = after_start.find('"')
-        if q == -1:
-            return any(fn.startswith(after_start) for fn in self.fn_names)
-
-        fn_name = after_start[:q]
-        if fn_name not in self.fn_map:
-            return False
-        fn = self.fn_map[fn_name]
-
-        # phase 3: fixed middle '", "parameters": {'
-        after_fn = after_start[len(fn_name):]
-        n = min(len(after_fn), len(FIXED_MIDDLE))
-        if after_fn[:n] != FIXED_MIDDLE[:n]:
-            return False
-        if len(after_fn) <= len(FIXED_MIDDLE):
-            return True
-
-        # phase 4: parameters
-        params_text = after_fn[len(FIXED_MIDDLE):]
-        return self._is_valid_params(params_text, list(fn.parameters.items()))
-
-    def _is_valid_params(
-        self,
-        text: str,
-        params: list[tuple]
-    ) -> bool:
-        """Check if text is a valid prefix of the parameters section."""
-        for i, (name, pdef) in enumerate(params):
-
-            # comma separator between params
-            if i > 0:
-                sep = ', '
-                if not text.startswith(sep):
-                    return sep.startswith(text)
-                text = text[len(sep):]
-
-            # key: "name": value
-            key = f'"{name}": '
-            if not text.startswith(key):
-                return key.startswith(text)
-            text = text[len(key):]
-
-            # value — constrained by type
-            if pdef.type in ('number', 'integer'):
-                j = 0
-                while j < len(text) and text[j] in '0123456789.-':
-                    j += 1
-                if j == 0:
-                    return True  # number not started yet
-                text = text[j:]
-                if not text:
-                    return True  # number not finished yet
-
-            elif pdef.type == 'string':
-                if not text.startswith('"'):
-                    return not text  # waiting for opening quote
-                text = text[1:]
-                q = text.find('"')
-                if q == -1:
-                    return True  # string not closed yet
-                text = text[q + 1:]
-
-            elif pdef.type == 'boolean':
-                for b in ('true', 'false'):
-                    if b.startswith(text):
-                        return True
-                    if text.startswith(b):
-                        text = text[len(b):]
-                        break
-                else:
-                    return False
-
-        # all params done — expect '}}'
-        return FIXED_END.startswith(text) if text else True
+        return self.machine.run(candidate) is not None
@@ -75,19 +75,31 @@ def load_prompt(path: str) -> list[Prompt]:
     return out
 
 
-def build_prompt(prompt: str, functions: list[FuncDef]) -> str:
-    """merge prompt with functions calling so the llm can predicted 
+def build_prefix(functions: list[FuncDef]) -> str:
+    """Function catalog that starts every prompt
 
     Args:
-        prompt: what humans says
         functions: what we can help with
 
     Returns:
-        a string of data
+        the "Available functions:" block, the same for every prompt
     """
     lines = ["Available functions:"]
     for fn in functions:
         params = ", ".join(f"{k}: {v.type}" for k, v in fn.parameters.items())
         lines.append(f"- {fn.name}({params})")
-    lines.append(f"\nUser request: {prompt}\n\nOutput:")
     return "\n".join(lines)
+
+
+def build_prompt(prompt: str, functions: list[FuncDef]) -> str:
+    """merge prompt with functions calling so the llm can predicted 
+
+    Args:
+        prompt: what humans says
+        functions: what we can help with
+
+    Returns:
+        a string of data
+    """
+    request = f"\n\nUser request: {prompt}\n\nOutput:"
+    return build_prefix(functions) + request
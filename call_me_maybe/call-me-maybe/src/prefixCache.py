@@ -0,0 +1,82 @@
+"""KV cache of the function catalog shared by every prompt."""
+import hashlib
+import json
+from typing import Any
+
+import numpy as np
+from llm_sdk import Small_LLM_Model
+
+from .funcDef import FuncDef
+from .load_file import build_prefix
+
+
+def prefix_key(functions: list[FuncDef], model_name: str) -> str:
+    """Hash of the function definitions and the model name.
+
+    Args:
+        functions: function definitions, as loaded
+        model_name: model whose kv state is cached
+
+    Returns:
+        hex sha256 digest
+    """
+    defs = json.dumps([fn.model_dump() for fn in functions], sort_keys=True)
+    return hashlib.sha256(f'{model_name}\n{defs}'.encode()).hexdigest()
+
+
+class PrefixCache:
+    """Runs the "Available functions:" block through the model once and
+    keeps the kv snapshot, so a prompt only prefills its own request.
+
+    The last token of the block is left out of the snapshot: it may
+    merge with the first chars of the request when the whole prompt is
+    tokenized (e.g. ')' + '\\n\\n').
+    """
+
+    def __init__(self, model: Small_LLM_Model) -> None:
+        self.model = model
+        self._entries: dict[str, tuple[list[int], Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def snapshot(self, functions: list[FuncDef]) -> tuple[list[int], Any]:
+        """Token ids of the prefix and the kv state after them.
+
+        Args:
+            functions: function definitions of the prompts
+
+        Returns:
+            (ids, kv snapshot), computed on the first call for functions
+        """
+        key = prefix_key(functions, self.model.model_name)
+        entry = self._entries.get(key)
+        if entry is None:
+            text = build_prefix(functions)
+            ids: list[int] = self.model.encode(text)[0].tolist()[:-1]
+            self.model.reset_cache()
+            if ids:
+                self.model.get_next_logits(ids)
+            entry = (ids, self.model.snapshot_cache())
+            self._entries[key] = entry
+        return entry
+
+    def prefill(self, functions: list[FuncDef], ids: list[int]) -> np.ndarray:
+        """Start the generation of a prompt from the cached prefix.
+
+        Args:
+            functions: function definitions the prompt was built with
+            ids: token ids of the whole prompt
+
+        Returns:
+            logits of the first generated token
+        """
+        shared, past = self.snapshot(functions)
+        if shared and ids[:len(shared)] == shared and len(ids) > len(shared):
+            self.hits += 1
+            self.model.restore_cache(past)
+            ids = ids[len(shared):]
+        else:  # not built with build_prompt(): run it all
+            self.misses += 1
+            self.model.reset_cache()
+        logits: np.ndarray = self.model.get_next_logits(ids).numpy()
+        return logits
@@ -0,0 +1,146 @@
+"""Character-level state machine compiled from the function schemas."""
+from .funcDef import FuncDef
+
+FIXED_START = '{"name": "'
+FIXED_MIDDLE = '", "parameters": {'
+FIXED_END = '}}'
+NUMBER_CHARS = '0123456789.-'
+VALUE_KINDS = {
+    'number': 'num', 'integer': 'num', 'string': 'str', 'boolean': 'bool'
+}
+BOOLEANS = ('true', 'false')
+
+# ('start', pos)         inside FIXED_START
+# ('name', prefix)       function name typed so far
+# ('fn', f, seg, sub)    segment seg of function f (sub: position in it)
+# ('accept',)            anything goes from here
+State = tuple
+Moves = tuple[dict[str, State], State | None]
+ACCEPT: State = ('accept',)
+
+
+def compile_function(fn: FuncDef) -> list[tuple[str, str]]:
+    """Output after the function name as segments: ('lit', text) to
+    copy, ('num' | 'str' | 'bool', '') for a value.
+
+    Args:
+        fn: function definition
+
+    Returns:
+        segments, from the quote closing the name to the final '}}'
+    """
+    segments: list[tuple[str, str]] = []
+    lit = FIXED_MIDDLE
+    for i, (name, pdef) in enumerate(fn.parameters.items()):
+        if i > 0:
+            lit += ', '
+        lit += f'"{name}": '
+        kind = VALUE_KINDS.get(pdef.type)
+        if kind:  # other types take no value text
+            segments.append(('lit', lit))
+            segments.append((kind, ''))
+            lit = ''
+    segments.append(('lit', lit + FIXED_END))
+    return segments
+
+
+class SchemaMachine:
+    """Accepts every prefix of {"name": "fn_x", "parameters": {"p": v}}
+
+    A state only knows the next characters (moves), so checking a token
+    is a walk of its characters from the current state instead of
+    parsing the whole output again.
+    """
+
+    start: State = ('start', 0)
+
+    def __init__(self, functions: list[FuncDef]) -> None:
+        self.fn_names: list[str] = [fn.name for fn in functions]
+        self.fn_index: dict[str, int] = {
+            name: i for i, name in enumerate(self.fn_names)
+        }
+        self.programs: list[list[tuple[str, str]]] = [
+            compile_function(fn) for fn in functions
+        ]
+        self._moves: dict[State, Moves] = {}
+
+    def enter(self, f: int, seg: int) -> State:
+        """State at the start of segment seg (past the end: finished)"""
+        return ('fn', f, seg, 0)
+
+    def moves(self, state: State) -> Moves:
+        """Next characters from a state.
+
+        Returns:
+            (char -> next state, state for every other char or None)
+        """
+        found = self._moves.get(state)
+        if found is None:
+            found = self._compute_moves(state)
+            self._moves[state] = found
+        return found
+
+    def _compute_moves(self, state: State) -> Moves:
+        """moves() without the memo"""
+        if state == ACCEPT:
+            return {}, ACCEPT
+        if state[0] == 'start':
+            pos = state[1] + 1
+            nxt = ('start', pos) if pos < len(FIXED_START) else ('name', '')
+            return {FIXED_START[state[1]]: nxt}, None
+        if state[0] == 'name':
+            prefix: str = state[1]
+            table: dict[str, State] = {}
+            for name in self.fn_names:
+                if len(name) > len(prefix) and name.startswith(prefix):
+                    ch = name[len(prefix)]
+                    table[ch] = ('name', prefix + ch)
+            if prefix in self.fn_index:
+                # the closing quote is the first char of FIXED_MIDDLE
+                table['"'] = ('fn', self.fn_index[prefix], 0, 1)
+            return table, None
+
+        _, f, seg, sub = state
+        program = self.programs[f]
+        if seg >= len(program):
+            return {}, None
+        kind, text = program[seg]
+        if kind == 'lit':
+            nxt = ('fn', f, seg, sub + 1) if sub + 1 < len(text) \
+                else self.enter(f, seg + 1)
+            return {text[sub]: nxt}, None
+        if kind == 'str':
+            if sub == 0:
+                return {'"': ('fn', f, seg, 1)}, None
+            return {'"': self.enter(f, seg + 1)}, state
+        if kind == 'num':
+            digits = ('fn', f, seg, 1)
+            if sub == 0:
+                # a value that does not start like a number is not checked
+                return {ch: digits for ch in NUMBER_CHARS}, ACCEPT
+            after, default = self.moves(self.enter(f, seg + 1))
+            table = dict(after)
+            table.update({ch: digits for ch in NUMBER_CHARS})
+            return table, default
+        # boolean: sub = 10 * word + chars of the word typed
+        if sub == 0:
+            return {word[0]: ('fn', f, seg, 10 * i + 1)
+                    for i, word in enumerate(BOOLEANS)}, None
+        word, pos = BOOLEANS[sub // 10], sub % 10
+        nxt = ('fn', f, seg, sub + 1) if pos + 1 < len(word) \
+            else self.enter(f, seg + 1)
+        return {word[pos]: nxt}, None
+
+    def step(self, state: State, ch: str) -> State | None:
+        """State after one char, None when the output can't be valid"""
+        table, default = self.moves(state)
+        return table.get(ch, default)
+
+    def run(self, text: str, state: State | None = None) -> State | None:
+        """State after text (from the start by default), None if invalid"""
+        current: State | None = self.start if state is None else state
+        for ch in text:
+            if current is None:
+                return None
+            current = self.step(current, ch)
+        return current
@@ -0,0 +1,111 @@
+"""Vocabulary indexed as a prefix trie for constrained decoding."""
+from bisect import bisect_left
+
+import numpy as np
+
+from .schemaMachine import SchemaMachine, State
+
+
+class TokenTrie:
+    """Tokens sorted by text: the tokens sharing a prefix are a range,
+    so a trie node is (depth, lo, hi) and its children are found by
+    bisection. No node objects for a ~150k tokens vocabulary.
+    """
+
+    def __init__(self, id_to_text: dict[int, str]) -> None:
+        items = sorted((text, tid) for tid, text in id_to_text.items()
+                       if text)
+        self.keys: list[str] = [text for text, _ in items]
+        self.ids = np.array([tid for _, tid in items], dtype=np.int64)
+        self.size: int = max(id_to_text, default=-1) + 1
+        self._last: dict[str, np.ndarray] = {}
+
+    def last_pos(self, ch: str) -> np.ndarray:
+        """Last index of ch in every token (-1: not in it)"""
+        found = self._last.get(ch)
+        if found is None:
+            found = np.array([text.rfind(ch) for text in self.keys],
+                             dtype=np.int32)
+            self._last[ch] = found
+        return found
+
+    def child(self, depth: int, lo: int, hi: int, ch: str) -> tuple[int, int]:
+        """Range of the tokens of [lo, hi) with ch at position depth"""
+        prefix = self.keys[lo][:depth]
+        a = bisect_left(self.keys, prefix + ch, lo, hi)
+        b = bisect_left(self.keys, prefix + chr(ord(ch) + 1), a, hi)
+        return a, b
+
+    def allowed(self, machine: SchemaMachine, state: State) -> np.ndarray:
+        """Tokens whose every char the machine accepts from state.
+
+        Only the branches the state can follow are walked. A state that
+        loops on every char but a few (inside a string, after an
+        unchecked value) takes whole ranges at once.
+
+        Returns:
+            boolean mask indexed by token id
+        """
+        mask = np.zeros(self.size, dtype=bool)
+        stack: list[tuple[int, int, int, State]] = [
+            (0, 0, len(self.keys), state)
+        ]
+        while stack:
+            depth, lo, hi, current = stack.pop()
+            if lo >= hi:
+                continue
+            table, default = machine.moves(current)
+            if default == current:
+                self._loop(mask, machine, depth, lo, hi, current, table)
+                continue
+
+            # tokens equal to the prefix sort first
+            end = lo
+            while end < hi and len(self.keys[end]) == depth:
+                end += 1
+            mask[self.ids[lo:end]] = True
+
+            ranges = []
+            for ch, nxt in table.items():
+                a, b = self.child(depth, end, hi, ch)
+                if a < b:
+                    ranges.append((a, b))
+                    stack.append((depth + 1, a, b, nxt))
+            if default is None:
+                continue
+            # every other next char leads to default
+            ranges.sort()
+            gaps, pos = [], end
+            for a, b in ranges:
+                gaps.append((pos, a))
+                pos = b
+            gaps.append((pos, hi))
+            loops = machine.moves(default)[1] == default
+            for a, b in gaps:
+                if loops:
+                    stack.append((depth + 1, a, b, default))
+                else:
+                    for k in range(a, b):
+                        if machine.run(self.keys[k][depth + 1:], default):
+                            mask[self.ids[k]] = True
+        return mask
+
+    def _loop(
+        self,
+        mask: np.ndarray,
+        machine: SchemaMachine,
+        depth: int,
+        lo: int,
+        hi: int,
+        state: State,
+        exits: dict[str, State]
+    ) -> None:
+        """Tokens of [lo, hi) from a state that only the exits chars
+        leave: without them past depth a token is accepted as is."""
+        stay = np.ones(hi - lo, dtype=bool)
+        for ch in exits:
+            stay &= self.last_pos(ch)[lo:hi] < depth
+        mask[self.ids[lo:hi][stay]] = True
+        for k in np.flatnonzero(~stay) + lo:
+            if machine.run(self.keys[k][depth:], state) is not None:
+                mask[self.ids[k]] = True
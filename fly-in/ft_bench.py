@@ -0,0 +1,201 @@
+""" Benchmark every map of a folder in parallel and check regressions """
+import argparse
+import csv
+import json
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from errors import FlyInError
+from ft_compact import CompactGame
+from ft_maps import find_maps
+from ft_parser import Parser
+from ft_sim import Sim
+
+Row = Dict[str, Any]
+FIELDS = ['map', 'planner', 'compact', 'hubs', 'links', 'drones', 'parse_s',
+          'plan_s', 'run_s', 'turns', 'done', 'peak_kb', 'expanded', 'error']
+
+
+def run_map(
+        path: str,
+        planner: str,
+        max_turns: int,
+        compact: bool,
+        row: Row
+        ) -> None:
+    """Parse, plan and run one map headless, time every phase
+
+    Fills the sizes, timings and results of row.
+    """
+    start = time.perf_counter()
+    game = Parser(path, CompactGame() if compact else None).ft_parse()
+    row['parse_s'] = time.perf_counter() - start
+    if game.s_hub is None or game.e_hub is None:
+        raise FlyInError("Missing start or End")
+    game.widen_ends()
+    row['hubs'] = len(game.all_hubs())
+    row['links'] = len(game.net)
+    row['drones'] = game.nb_drones
+
+    start = time.perf_counter()
+    sim = Sim(game, planner)
+    row['plan_s'] = time.perf_counter() - start
+
+    res = sim.run_to_completion(max_turns)
+    row.update(run_s=res.seconds, turns=res.turns, done=res.done,
+               expanded=sim.pathfinder.nb_expanded)
+
+
+def bench_map(
+        path: str,
+        planner: str = 'greedy',
+        max_turns: int = 0,
+        compact: bool = False,
+        memory: bool = True
+        ) -> Row:
+    """Benchmark one map: a timed run, then a traced run for the memory
+
+    tracemalloc slows Python code down several times (and not by the
+    same factor on every map), so the timings never come from the
+    traced run.
+
+    Args:
+        path: map file
+        planner: 'greedy' or 'flow'
+        max_turns: stop the run after that many turns (0: no limit)
+        compact: load the map in a CompactGame
+        memory: also measure the peak memory (second run)
+
+    Return:
+        one report row (see FIELDS)
+    """
+    row: Row = dict.fromkeys(FIELDS, None)
+    row.update(map=path, planner=planner, compact=compact, error='')
+    try:
+        run_map(path, planner, max_turns, compact, row)
+        if memory:
+            tracemalloc.start()
+            try:
+                run_map(path, planner, max_turns, compact, {})
+                row['peak_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+            finally:
+                tracemalloc.stop()
+    except (FlyInError, ValueError) as e:
+        row['error'] = str(e)
+    return row
+
+
+def run_all(
+        paths: List[str],
+        planner: str,
+        workers: Optional[int],
+        max_turns: int,
+        compact: bool = False,
+        memory: bool = True
+        ) -> List[Row]:
+    """Run bench_map on every path with a pool of processes"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(bench_map, p, planner, max_turns, compact,
+                               memory)
+                   for p in paths]
+        return [f.result() for f in futures]
+
+
+def compare(rows: List[Row], baseline: List[Row], slower: float) -> List[str]:
+    """Regressions against a stored report
+
+    A map regresses when it now needs more turns, stops finishing, or
+    its plan + run time grows more than `slower` times.
+    """
+    old = {(r['map'], r['planner'], r.get('compact', False)): r
+           for r in baseline}
+    issues: List[str] = []
+    for row in rows:
+        ref = old.get((row['map'], row['planner'], row['compact']))
+        if ref is None or ref['error']:
+            continue
+        if row['error']:
+            issues.append(f"{row['map']}: {row['error']}")
+        elif ref['done'] and not row['done']:
+            issues.append(f"{row['map']}: does not finish anymore")
+        elif row['turns'] > ref['turns']:
+            issues.append(
+                f"{row['map']}: turns {ref['turns']} -> {row['turns']}")
+        else:
+            was = ref['plan_s'] + ref['run_s']
+            now = row['plan_s'] + row['run_s']
+            # tiny maps run in microseconds, only flag real slowdowns
+            if now > was * slower and now - was > 0.01:
+                issues.append(
+                    f"{row['map']}: {was * 1000:.1f} ms"
+                    + f" -> {now * 1000:.1f} ms")
+    return issues
+
+
+def write_report(rows: List[Row], out: str) -> None:
+    """Save rows as json or csv (from the extension)"""
+    with open(out, 'w', newline='') as f:
+        if out.endswith('.csv'):
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(rows, f, indent=2)
+
+
+def print_table(rows: List[Row]) -> None:
+    """Short summary on stdout"""
+    print(f"{'map':<48} {'hubs':>6} {'turns':>6} {'parse':>9}"
+          + f" {'plan':>9} {'run':>9} {'peak':>8} {'expanded':>9}")
+    for r in rows:
+        if r['error']:
+            print(f"{r['map']:<48} ERROR: {r['error']}")
+            continue
+        peak = '-' if r['peak_kb'] is None else f"{r['peak_kb']}kB"
+        print(f"{r['map']:<48} {r['hubs']:>6} {r['turns']:>6}"
+              + f" {r['parse_s'] * 1000:>7.1f}ms {r['plan_s'] * 1000:>7.1f}ms"
+              + f" {r['run_s'] * 1000:>7.1f}ms {peak:>8}"
+              + f" {r['expanded']:>9}")
+
+
+def main() -> None:
+    """ python ft_bench.py ../maps -o report.json --baseline base.json """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('maps', nargs='?', default='../maps',
+                        help='map file or folder (searched recursively)')
+    parser.add_argument('-o', '--output', help='report .json or .csv')
+    parser.add_argument('--baseline', help='previous .json report')
+    parser.add_argument('--planner', choices=['greedy', 'flow'],
+                        default='greedy')
+    parser.add_argument('--compact', action='store_true',
+                        help='array backed maps (ft_compact.CompactGame)')
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    parser.add_argument('--max-turns', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the traced run measuring peak memory')
+    parser.add_argument('--slower', type=float, default=1.5,
+                        help='allowed slowdown factor against the baseline')
+    args = parser.parse_args()
+
+    paths = find_maps(args.maps)
+    if not paths:
+        sys.exit(f"No map found in {args.maps}")
+    rows = run_all(paths, args.planner, args.workers, args.max_turns,
+                   args.compact, not args.no_memory)
+    print_table(rows)
+    if args.output:
+        write_report(rows, args.output)
+    if args.baseline:
+        with open(args.baseline) as f:
+            issues = compare(rows, json.load(f), args.slower)
+        for issue in issues:
+            print(f'REGRESSION {issue}')
+        if issues:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,460 @@
+""" Array backed map for very large fly-in maps
+
+Hubs and links are interned to int ids and their data lives in columns
+(array module, zero-copy NumPy views with columns()). Connections are
+stored in CSR form once frozen. CompactGame keeps the Game / Hub / Net
+API as thin views over the columns, so the parser, Pathfinder, Sim and
+Scheduler run on it unchanged.
+"""
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from models import Game, Hub, Metadata, Net, Zone
+
+ZONES: List[Zone] = list(Zone)
+ZONE_CODE: Dict[Zone, int] = {zone: i for i, zone in enumerate(ZONES)}
+
+
+class CompactGraph:
+    """Columns of the map, one row per hub and one row per link"""
+
+    def __init__(self) -> None:
+        """ empty graph """
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.xs = array('i')
+        self.ys = array('i')
+        self.zones = array('b')
+        self.max_drones = array('i')
+        self.colors: Dict[int, str] = {}
+        self.occupancy = array('i')
+        self.link_a = array('i')
+        self.link_b = array('i')
+        self.link_cap = array('i')
+        self.usage = array('i')
+        self.offsets = array('i', [0])
+        self.targets = array('i')
+        self.edges = array('i')
+        self._nb_frozen = 0
+
+    def add_hub(self, name: str, x: int, y: int, meta: Metadata) -> int:
+        """Intern a hub and return its id"""
+        idx = len(self.names)
+        self.names.append(name)
+        self.ids[name] = idx
+        self.xs.append(x)
+        self.ys.append(y)
+        self.zones.append(ZONE_CODE[meta.zone])
+        self.max_drones.append(meta.max_drones)
+        if meta.color is not None:
+            self.colors[idx] = meta.color
+        self.occupancy.append(0)
+        return idx
+
+    def add_link(self, a: int, b: int, cap: int) -> int:
+        """Add the connection a-b and return its id"""
+        self.link_a.append(a)
+        self.link_b.append(b)
+        self.link_cap.append(cap)
+        self.usage.append(0)
+        return len(self.link_a) - 1
+
+    def nb_hubs(self) -> int:
+        """Number of hubs"""
+        return len(self.names)
+
+    def nb_links(self) -> int:
+        """Number of connections"""
+        return len(self.link_a)
+
+    def freeze(self) -> None:
+        """Build the CSR adjacency (offsets, targets, edges) with a
+        counting sort, neighbors keep the order of the map file"""
+        n = self.nb_hubs()
+        degree = array('i', bytes(4 * (n + 1)))
+        for a, b in zip(self.link_a, self.link_b):
+            degree[a + 1] += 1
+            degree[b + 1] += 1
+        for i in range(n):
+            degree[i + 1] += degree[i]
+        self.offsets = array('i', degree)
+        fill = array('i', degree[:n])
+        size = 2 * self.nb_links()
+        self.targets = array('i', bytes(4 * size))
+        self.edges = array('i', bytes(4 * size))
+        for e, (a, b) in enumerate(zip(self.link_a, self.link_b)):
+            self.targets[fill[a]] = b
+            self.edges[fill[a]] = e
+            fill[a] += 1
+            self.targets[fill[b]] = a
+            self.edges[fill[b]] = e
+            fill[b] += 1
+        self._nb_frozen = self.nb_links()
+
+    def frozen(self) -> bool:
+        """The CSR is up to date"""
+        return self._nb_frozen == self.nb_links() \
+            and len(self.offsets) == self.nb_hubs() + 1
+
+    def neighbors(self, hub: int) -> Iterator[Tuple[int, int]]:
+        """(neighbor id, link id) of a hub"""
+        lo, hi = self.offsets[hub], self.offsets[hub + 1]
+        return zip(self.targets[lo:hi], self.edges[lo:hi])
+
+    def link_between(self, a: int, b: int) -> int:
+        """Id of the link a-b, -1 if there is none (O(degree of a))"""
+        for i in range(self.offsets[a], self.offsets[a + 1]):
+            if self.targets[i] == b:
+                return self.edges[i]
+        return -1
+
+    def nbytes(self) -> int:
+        """Memory of the columns (names and ids table not counted)"""
+        cols = (self.xs, self.ys, self.zones, self.max_drones,
+                self.occupancy, self.link_a, self.link_b,
+                self.link_cap, self.usage, self.offsets, self.targets,
+                self.edges)
+        return sum(col.itemsize * len(col) for col in cols)
+
+    def columns(self) -> Dict[str, Any]:
+        """Zero-copy NumPy views of the columns (needs numpy)"""
+        import numpy as np
+        cols = {
+                'x': self.xs, 'y': self.ys, 'zone': self.zones,
+                'max_drones': self.max_drones, 'occupancy': self.occupancy,
+                'link_a': self.link_a, 'link_b': self.link_b,
+                'link_cap': self.link_cap, 'usage': self.usage,
+                'offsets': self.offsets, 'targets': self.targets,
+                'edges': self.edges}
+        return {key: np.frombuffer(col, dtype=col.typecode)
+                for key, col in cols.items()}
+
+
+class HubMeta(Metadata):
+    """Metadata of a hub read from the columns"""
+    __slots__ = ('graph', 'idx')
+
+    def __init__(self, graph: CompactGraph, idx: int) -> None:
+        """ view of the row idx """
+        self.graph = graph
+        self.idx = idx
+
+    @property
+    def zone(self) -> Zone:
+        return ZONES[self.graph.zones[self.idx]]
+
+    @zone.setter
+    def zone(self, value: Zone) -> None:
+        self.graph.zones[self.idx] = ZONE_CODE[value]
+
+    @property
+    def color(self) -> Optional[str]:
+        return self.graph.colors.get(self.idx)
+
+    @color.setter
+    def color(self, value: Optional[str]) -> None:
+        if value is None:
+            self.graph.colors.pop(self.idx, None)
+        else:
+            self.graph.colors[self.idx] = value
+
+    @property
+    def max_drones(self) -> int:
+        return self.graph.max_drones[self.idx]
+
+    @max_drones.setter
+    def max_drones(self, value: int) -> None:
+        self.graph.max_drones[self.idx] = value
+
+    @property
+    def max_link_capacity(self) -> int:
+        return 1
+
+    @max_link_capacity.setter
+    def max_link_capacity(self, value: int) -> None:
+        raise AttributeError("hubs have no link capacity")
+
+
+class LinkMeta(Metadata):
+    """Metadata of a connection read from the columns"""
+    __slots__ = ('graph', 'idx')
+
+    def __init__(self, graph: CompactGraph, idx: int) -> None:
+        """ view of the link idx """
+        self.graph = graph
+        self.idx = idx
+
+    @property
+    def zone(self) -> Zone:
+        return Zone.normal
+
+    @zone.setter
+    def zone(self, value: Zone) -> None:
+        raise AttributeError("connections have no zone")
+
+    @property
+    def color(self) -> Optional[str]:
+        return None
+
+    @color.setter
+    def color(self, value: Optional[str]) -> None:
+        raise AttributeError("connections have no color")
+
+    @property
+    def max_drones(self) -> int:
+        return 1
+
+    @max_drones.setter
+    def max_drones(self, value: int) -> None:
+        raise AttributeError("connections have no max_drones")
+
+    @property
+    def max_link_capacity(self) -> int:
+        return self.graph.link_cap[self.idx]
+
+    @max_link_capacity.setter
+    def max_link_capacity(self, value: int) -> None:
+        self.graph.link_cap[self.idx] = value
+
+
+class HubView(Hub):
+    """Hub API over one row of a CompactGraph"""
+    __slots__ = ('graph', 'idx', '_meta')
+
+    def __init__(self, graph: CompactGraph, idx: int) -> None:
+        """ view of the row idx """
+        self.graph = graph
+        self.idx = idx
+        self._meta = HubMeta(graph, idx)
+
+    @property
+    def name(self) -> str:
+        return self.graph.names[self.idx]
+
+    @name.setter
+    def name(self, value: str) -> None:
+        raise AttributeError("hub names are interned")
+
+    @property
+    def x(self) -> int:
+        return self.graph.xs[self.idx]
+
+    @x.setter
+    def x(self, value: int) -> None:
+        self.graph.xs[self.idx] = value
+
+    @property
+    def y(self) -> int:
+        return self.graph.ys[self.idx]
+
+    @y.setter
+    def y(self, value: int) -> None:
+        self.graph.ys[self.idx] = value
+
+    @property
+    def meta(self) -> Metadata:
+        return self._meta
+
+    @meta.setter
+    def meta(self, value: Metadata) -> None:
+        raise AttributeError("edit the fields of meta instead")
+
+    @property
+    def occupied(self) -> int:
+        return self.graph.occupancy[self.idx]
+
+    @occupied.setter
+    def occupied(self, value: int) -> None:
+        self.graph.occupancy[self.idx] = value
+
+    def __eq__(self, other: object) -> bool:
+        """Same row of the same graph"""
+        return isinstance(other, HubView) and other.idx == self.idx \
+            and other.graph is self.graph
+
+    def occupancy(self) -> int:
+        """Number of drones in (or heading to) the hub"""
+        return self.graph.occupancy[self.idx]
+
+    def occupy(self) -> None:
+        """A drone takes a place in the hub"""
+        self.graph.occupancy[self.idx] += 1
+
+    def leave(self) -> None:
+        """A drone frees its place"""
+        self.graph.occupancy[self.idx] -= 1
+
+
+class NetView(Net):
+    """Net API over one link of a CompactGraph"""
+    __slots__ = ('graph', 'idx', '_meta')
+
+    def __init__(self, graph: CompactGraph, idx: int) -> None:
+        """ view of the link idx """
+        self.graph = graph
+        self.idx = idx
+        self._meta = LinkMeta(graph, idx)
+
+    @property
+    def name1(self) -> str:
+        return self.graph.names[self.graph.link_a[self.idx]]
+
+    @name1.setter
+    def name1(self, value: str) -> None:
+        raise AttributeError("links are interned")
+
+    @property
+    def name2(self) -> str:
+        return self.graph.names[self.graph.link_b[self.idx]]
+
+    @name2.setter
+    def name2(self, value: str) -> None:
+        raise AttributeError("links are interned")
+
+    @property
+    def meta(self) -> Metadata:
+        return self._meta
+
+    @meta.setter
+    def meta(self, value: Metadata) -> None:
+        raise AttributeError("edit the fields of meta instead")
+
+    @property
+    def usage(self) -> int:
+        return self.graph.usage[self.idx]
+
+    @usage.setter
+    def usage(self, value: int) -> None:
+        self.graph.usage[self.idx] = value
+
+    @property
+    def x(self) -> float:
+        """Middle of the link (what stay_in() would store)"""
+        graph = self.graph
+        return (graph.xs[graph.link_a[self.idx]]
+                + graph.xs[graph.link_b[self.idx]]) / 2
+
+    @x.setter
+    def x(self, value: float) -> None:
+        raise AttributeError("the middle of a link is computed")
+
+    @property
+    def y(self) -> float:
+        graph = self.graph
+        return (graph.ys[graph.link_a[self.idx]]
+                + graph.ys[graph.link_b[self.idx]]) / 2
+
+    @y.setter
+    def y(self, value: float) -> None:
+        raise AttributeError("the middle of a link is computed")
+
+    def __eq__(self, other: object) -> bool:
+        """Same link of the same graph"""
+        return isinstance(other, NetView) and other.idx == self.idx \
+            and other.graph is self.graph
+
+    def stay_in(self, hub_a: Hub, hub_b: Hub) -> None:
+        """ the middle is always known """
+
+
+class CompactGame(Game):
+    """Game API over a CompactGraph
+
+    Views are made once per hub and on demand per link, so `is` and
+    dict lookups behave like with the dataclass Game.
+    """
+
+    def __init__(self, nb_drones: int = 0) -> None:
+        """ empty map (fill it with the Parser or add_hub/add_net) """
+        self.nb_drones = nb_drones
+        self.s_hub: Optional[Hub] = None
+        self.e_hub: Optional[Hub] = None
+        self.graph = CompactGraph()
+        self._views: List[HubView] = []
+        self._net_views: Dict[int, NetView] = {}
+        self._hub_table: Dict[str, Hub] = {}
+        self._net_table: Optional[Dict[str, Net]] = None
+
+    @property
+    def hubs(self) -> Dict[str, Hub]:
+        """Middle hubs (start and end excluded), built on demand"""
+        return {hub.name: hub for hub in self._views
+                if hub is not self.s_hub and hub is not self.e_hub}
+
+    @hubs.setter
+    def hubs(self, value: Dict[str, Hub]) -> None:
+        raise AttributeError("use add_hub()")
+
+    @property
+    def net(self) -> Dict[str, Net]:
+        """Every connection by name, built once on demand"""
+        if self._net_table is None \
+                or len(self._net_table) != self.graph.nb_links():
+            self._net_table = {}
+            for e in range(self.graph.nb_links()):
+                view = self.view_net(e)
+                self._net_table[view.get_name()] = view
+        return self._net_table
+
+    @net.setter
+    def net(self, value: Dict[str, Net]) -> None:
+        raise AttributeError("use add_net()")
+
+    def view_net(self, e: int) -> NetView:
+        """The (cached) view of link e"""
+        view = self._net_views.get(e)
+        if view is None:
+            view = NetView(self.graph, e)
+            self._net_views[e] = view
+        return view
+
+    def add_hub(self, hub: Hub, key: str = 'hub') -> None:
+        """Copy a parsed hub into the columns"""
+        idx = self.graph.add_hub(hub.name, hub.x, hub.y, hub.meta)
+        view = HubView(self.graph, idx)
+        self._views.append(view)
+        self._hub_table[hub.name] = view
+        if key == 'start_hub':
+            self.s_hub = view
+        elif key == 'end_hub':
+            self.e_hub = view
+
+    def add_net(self, net: Net) -> None:
+        """Copy a parsed connection into the columns"""
+        ids = self.graph.ids
+        self.graph.add_link(ids[net.name1], ids[net.name2],
+                            net.meta.max_link_capacity)
+
+    def build_index(self) -> None:
+        """Build the CSR adjacency"""
+        self.graph.freeze()
+
+    def ensure_index(self) -> None:
+        """Rebuild the CSR if links were added since"""
+        if not self.graph.frozen():
+            self.graph.freeze()
+
+    def all_hubs(self) -> Dict[str, Hub]:
+        """Every hub view by name (shared table, do not modify it)"""
+        return self._hub_table
+
+    def get_neighbors(self, hub_name: Optional[str]) -> List[Tuple[Hub, Net]]:
+        """ neighbors of a hub, views made from the CSR row"""
+        self.ensure_index()
+        if hub_name is None or hub_name not in self.graph.ids:
+            raise ValueError(f"Unknown hub: {hub_name}")
+        views = self._views
+        return [(views[n], self.view_net(e))
+                for n, e in self.graph.neighbors(self.graph.ids[hub_name])]
+
+    def get_network(self, origine: Hub, target: Hub) -> Optional[Net]:
+        """Link between origine and target (None if there is none)"""
+        self.ensure_index()
+        ids = self.graph.ids
+        e = self.graph.link_between(ids[origine.name], ids[target.name])
+        return None if e < 0 else self.view_net(e)
+
+    def clear_traffic(self) -> None:
+        """Empty every hub and free every link"""
+        graph = self.graph
+        graph.occupancy[:] = array('i', bytes(4 * graph.nb_hubs()))
+        graph.usage[:] = array('i', bytes(4 * graph.nb_links()))
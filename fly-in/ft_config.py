@@ -19,6 +19,30 @@ class Config:
         self.BORDER_WIDTH: int = 5
         self.RECT_SIZE: int = 35
 
+        # viewport: screen = fitted position * zoom + offset
+        self.zoom: float = 1.0
+        self.off_x: float = 0.0
+        self.off_y: float = 0.0
+        self.MIN_ZOOM: float = 0.25
+        self.MAX_ZOOM: float = 1024.0
+        self.ZOOM_STEP: float = 1.25
+        self.PAN_STEP: int = 100
+        # more visible hubs or links than that: draw clusters
+        self.MAX_HUBS: int = 1000
+        self.MAX_LINKS: int = 3000
+        self.MAX_EDGES: int = 1500
+        self.CLUSTER_PX: int = 40
+        self.VIEW_MARGIN: int = 150
+
+        # fixed timestep: the simulation moves by SIM_DT seconds a tick,
+        # at most MAX_TICKS ticks a frame (the extra time is dropped)
+        self.FPS: int = 60
+        self.SIM_DT: float = 1 / 60
+        self.MAX_TICKS: int = 240
+        self.MIN_SPEED: float = 0.25
+        self.MAX_SPEED: float = 64
+        self.FF_TURNS: int = 10
+
         self.START_COLOR: Tuple[int, int, int] = (0, 255, 0)
         self.END_COLOR: Tuple[int, int, int] = (255, 255, 0)
 
@@ -75,18 +99,88 @@ class Config:
             val: float,
             min_val: int,
             max_val: int,
-            size: int
+            size: int,
+            zoom: float = 1.0,
+            off: float = 0.0
             ) -> int:
-        """ convert from graph into screen according our size """
+        """ convert from graph into screen according our size
+
+        The whole map fits the window at zoom 1 and offset 0.
+        """
+        if max_val == min_val:
+            return int(size / 2 * zoom + off)
+        return int((((val - min_val) / (max_val - min_val)) *
+                    (size - 2 * self.PADDING) + self.PADDING) * zoom + off)
+
+    def zoom_out(
+            self,
+            pos: float,
+            min_val: int,
+            max_val: int,
+            size: int,
+            zoom: float,
+            off: float
+            ) -> float:
+        """ convert from screen back into graph (reverse of zoom_in) """
         if max_val == min_val:
-            return int(size / 2)
-        return int(((val - min_val) / (max_val - min_val)) *
-                   (size - 2 * self.PADDING) + self.PADDING)
+            return min_val
+        fit = (pos - off) / zoom
+        return (fit - self.PADDING) / (size - 2 * self.PADDING) * \
+            (max_val - min_val) + min_val
 
     def to_screen_x(self, val: float) -> int:
         """Shorthand: convert an x coordinate using self.width."""
-        return self.zoom_in(val, self.MIN_X, self.MAX_X, self.WIDTH)
+        return self.zoom_in(val, self.MIN_X, self.MAX_X, self.WIDTH,
+                            self.zoom, self.off_x)
 
     def to_screen_y(self, val: float) -> int:
         """Shorthand: convert a y coordinate using self.height."""
-        return self.zoom_in(val, self.MIN_Y, self.MAX_Y, self.HEIGHT)
+        return self.zoom_in(val, self.MIN_Y, self.MAX_Y, self.HEIGHT,
+                            self.zoom, self.off_y)
+
+    def to_map_x(self, pos: float) -> float:
+        """Map x under the screen column pos"""
+        return self.zoom_out(pos, self.MIN_X, self.MAX_X, self.WIDTH,
+                             self.zoom, self.off_x)
+
+    def to_map_y(self, pos: float) -> float:
+        """Map y under the screen row pos"""
+        return self.zoom_out(pos, self.MIN_Y, self.MAX_Y, self.HEIGHT,
+                             self.zoom, self.off_y)
+
+    def pixels_per_unit(self) -> Tuple[float, float]:
+        """Screen pixels for one map unit in x and y (inf on a flat map)"""
+        span_x = self.MAX_X - self.MIN_X
+        span_y = self.MAX_Y - self.MIN_Y
+        px_w = (self.WIDTH - 2 * self.PADDING) * self.zoom
+        px_h = (self.HEIGHT - 2 * self.PADDING) * self.zoom
+        return (px_w / span_x if span_x else float('inf'),
+                px_h / span_y if span_y else float('inf'))
+
+    def view(self, margin: int = 0) -> Tuple[float, float, float, float]:
+        """Map window seen on screen, widened by margin pixels
+
+        Return:
+            (min x, max x, min y, max y)
+        """
+        return (self.to_map_x(-margin), self.to_map_x(self.WIDTH + margin),
+                self.to_map_y(-margin), self.to_map_y(self.HEIGHT + margin))
+
+    def zoom_at(self, x: float, y: float, factor: float) -> None:
+        """Zoom by factor keeping the point under (x, y) in place"""
+        zoom = min(max(self.zoom * factor, self.MIN_ZOOM), self.MAX_ZOOM)
+        factor = zoom / self.zoom
+        self.off_x = x - (x - self.off_x) * factor
+        self.off_y = y - (y - self.off_y) * factor
+        self.zoom = zoom
+
+    def pan(self, dx: float, dy: float) -> None:
+        """Move the view by (dx, dy) pixels"""
+        self.off_x += dx
+        self.off_y += dy
+
+    def fit(self) -> None:
+        """Back to the whole map in the window"""
+        self.zoom = 1.0
+        self.off_x = 0.0
+        self.off_y = 0.0
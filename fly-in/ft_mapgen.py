@@ -0,0 +1,173 @@
+""" Synthetic fly-in maps (grid, ring, random graph) for stress tests """
+import argparse
+import math
+import random
+from typing import List, Optional, Tuple
+
+
+class MapGen:
+    """Write big valid map files to stress the parser and the solvers"""
+
+    ZONES = ('restricted', 'priority', 'blocked')
+
+    def __init__(
+            self,
+            drones: int = 10,
+            seed: Optional[int] = None,
+            restricted: float = 0.0,
+            priority: float = 0.0,
+            blocked: float = 0.0,
+            max_drones: int = 1,
+            max_link: int = 1
+            ) -> None:
+        """ settings shared by every shape
+
+        Args:
+            drones: nb_drones of the map
+            seed: random seed (same seed, same map)
+            restricted/priority/blocked: share of hubs with that zone
+            max_drones: max capacity of a hub (picked in 1..max_drones)
+            max_link: max capacity of a link (picked in 1..max_link)
+        """
+        self.drones = drones
+        self.rand = random.Random(seed)
+        self.odds = (restricted, priority, blocked)
+        self.max_drones = max_drones
+        self.max_link = max_link
+
+    def hub_meta(self) -> str:
+        """Random metadata of a middle hub"""
+        meta: List[str] = []
+        roll = self.rand.random()
+        for zone, odd in zip(self.ZONES, self.odds):
+            if roll < odd:
+                meta.append(f'zone={zone}')
+                break
+            roll -= odd
+        if self.max_drones > 1:
+            meta.append(f'max_drones={self.rand.randint(1, self.max_drones)}')
+        return f' [{" ".join(meta)}]' if meta else ''
+
+    def link_meta(self) -> str:
+        """Random metadata of a connection"""
+        if self.max_link > 1:
+            cap = self.rand.randint(1, self.max_link)
+            return f' [max_link_capacity={cap}]'
+        return ''
+
+    def render(
+            self,
+            hubs: List[Tuple[str, int, int]],
+            links: List[Tuple[int, int]]
+            ) -> List[str]:
+        """Map lines, first hub is the start and last hub is the end"""
+        lines = [f'nb_drones: {self.drones}']
+        last = len(hubs) - 1
+        for i, (name, x, y) in enumerate(hubs):
+            if i == 0:
+                lines.append(f'start_hub: {name} {x} {y}'
+                             + f' [max_drones={self.drones}]')
+            elif i == last:
+                lines.append(f'end_hub: {name} {x} {y}'
+                             + f' [max_drones={self.drones}]')
+            else:
+                lines.append(f'hub: {name} {x} {y}{self.hub_meta()}')
+        for a, b in links:
+            lines.append(
+                f'connection: {hubs[a][0]}-{hubs[b][0]}{self.link_meta()}')
+        return lines
+
+    def grid(self, width: int, height: int) -> List[str]:
+        """width x height grid, start and end in opposite corners"""
+        hubs = [(f'g{x}_{y}', x, y)
+                for y in range(height) for x in range(width)]
+        links: List[Tuple[int, int]] = []
+        for y in range(height):
+            for x in range(width):
+                i = y * width + x
+                if x + 1 < width:
+                    links.append((i, i + 1))
+                if y + 1 < height:
+                    links.append((i, i + width))
+        return self.render(hubs, links)
+
+    def ring(self, size: int, chords: int = 0) -> List[str]:
+        """size hubs on a ring (plus random chords), the end is on the
+        opposite side of the start"""
+        order = list(range(size))
+        half = size // 2
+        order[half], order[-1] = order[-1], order[half]
+        hubs: List[Tuple[str, int, int]] = []
+        for i in order:
+            angle = 2 * math.pi * i / size
+            hubs.append((f'r{i}', round(size * (1 + math.cos(angle))),
+                         round(size * (1 + math.sin(angle)))))
+        where = {i: k for k, i in enumerate(order)}
+        links = [(where[i], where[(i + 1) % size]) for i in range(size)]
+        links += self.extra(size, chords, links)
+        return self.render(hubs, links)
+
+    def random_graph(self, size: int, extra: int = 0) -> List[str]:
+        """Random spanning tree (so the end is reachable) plus extra
+        random connections, hubs on distinct random coordinates"""
+        side = max(2, int(size ** 0.5) * 2)
+        cells = self.rand.sample(range(side * side), size)
+        hubs = [(f'n{i}', cell % side, cell // side)
+                for i, cell in enumerate(cells)]
+        links: List[Tuple[int, int]] = []
+        for i in range(1, size):
+            links.append((self.rand.randrange(i), i))
+        links += self.extra(size, extra, links)
+        return self.render(hubs, links)
+
+    def extra(
+            self,
+            size: int,
+            count: int,
+            links: List[Tuple[int, int]]
+            ) -> List[Tuple[int, int]]:
+        """count new random connections (no loop, no duplicate)"""
+        seen = {(min(a, b), max(a, b)) for a, b in links}
+        res: List[Tuple[int, int]] = []
+        tries = 0
+        while len(res) < count and tries < count * 20:
+            tries += 1
+            a, b = self.rand.randrange(size), self.rand.randrange(size)
+            key = (min(a, b), max(a, b))
+            if a == b or key in seen:
+                continue
+            seen.add(key)
+            res.append((a, b))
+        return res
+
+
+def main() -> None:
+    """ python ft_mapgen.py grid 100 100 -o maps/big/grid.txt """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('shape', choices=['grid', 'ring', 'random'])
+    parser.add_argument('size', type=int, help='hubs (grid: width)')
+    parser.add_argument('extra', type=int, nargs='?', default=0,
+                        help='grid: height, ring: chords, random: links')
+    parser.add_argument('-o', '--output', required=True)
+    parser.add_argument('--drones', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--restricted', type=float, default=0.0)
+    parser.add_argument('--priority', type=float, default=0.0)
+    parser.add_argument('--blocked', type=float, default=0.0)
+    parser.add_argument('--max-drones', type=int, default=1)
+    parser.add_argument('--max-link', type=int, default=1)
+    args = parser.parse_args()
+    gen = MapGen(args.drones, args.seed, args.restricted, args.priority,
+                 args.blocked, args.max_drones, args.max_link)
+    if args.shape == 'grid':
+        lines = gen.grid(args.size, args.extra or args.size)
+    elif args.shape == 'ring':
+        lines = gen.ring(args.size, args.extra)
+    else:
+        lines = gen.random_graph(args.size, args.extra)
+    with open(args.output, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+if __name__ == '__main__':
+    main()
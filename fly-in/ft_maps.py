@@ -0,0 +1,11 @@
+""" Map files of a folder, shared by the command line tools """
+from pathlib import Path
+from typing import List
+
+
+def find_maps(root: str) -> List[str]:
+    """Every .txt map under root (or root itself if it is a file), sorted"""
+    base = Path(root)
+    if base.is_file():
+        return [str(base)]
+    return sorted(str(p) for p in base.rglob('*.txt'))
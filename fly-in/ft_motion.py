@@ -0,0 +1,51 @@
+""" Batched drone motion: every drone moves in one NumPy step """
+from typing import Any
+import numpy as np
+
+
+class Motion:
+    """Positions, goals and speeds of the fleet in arrays
+
+    Row i is the drone idx i + 1. A drone moves straight to its goal at
+    its speed and snaps on it when the step would reach it (same rule as
+    the per drone update it replaces).
+    """
+
+    def __init__(self, nb: int, x: float, y: float, speed: float) -> None:
+        """ nb drones parked at (x, y) """
+        self.pos: Any = np.empty((nb, 2))
+        self.pos[:] = (x, y)
+        self.goal: Any = self.pos.copy()
+        self.speed: Any = np.full(nb, speed, dtype=float)
+        self.moving: Any = np.zeros(nb, dtype=bool)
+
+    def go(self, i: int, x: float, y: float) -> None:
+        """Send drone row i to (x, y)"""
+        self.goal[i] = (x, y)
+        self.moving[i] = True
+
+    def busy(self) -> bool:
+        """Some drone has not reached its goal yet"""
+        return bool(self.moving.any())
+
+    def step(self, dt: float) -> Any:
+        """Move every moving drone by speed * dt
+
+        Return:
+            rows of the drones that reached their goal in this step
+        """
+        rows = np.flatnonzero(self.moving)
+        if not rows.size:
+            return rows
+        delta = self.goal[rows] - self.pos[rows]
+        dist = np.hypot(delta[:, 0], delta[:, 1])
+        speed = self.speed[rows]
+        with np.errstate(invalid='ignore'):
+            arrive = dist <= speed * dt
+        done = rows[arrive]
+        self.pos[done] = self.goal[done]
+        self.moving[done] = False
+        go = ~arrive
+        self.pos[rows[go]] += \
+            delta[go] / dist[go, None] * speed[go, None] * dt
+        return done
@@ -1,15 +1,31 @@
 from models import Game, Hub, Metadata, Zone, Net
 from errors import ParseError, ValidationError
-from typing import Optional
+from typing import Iterable, Optional, Set, Tuple, Union
 
 
 class Parser:
     """Parsing Part before the simulation"""
 
-    def __init__(self, filename: str) -> None:
-        """Start Parsing the file"""
+    def __init__(
+            self,
+            filename: str = "",
+            game: Optional[Game] = None
+            ) -> None:
+        """Start Parsing the file
+
+        names, coords and links grow with the lines so every duplicate
+        check is O(1) and a map parses in one linear pass.
+
+        Args:
+            filename: map file
+            game: game to fill (a CompactGame for huge maps), new Game
+                if None
+        """
         self.filename = filename
-        self.game = Game()
+        self.game = game if game is not None else Game()
+        self.names: Set[str] = set()
+        self.coords: Set[Tuple[int, int]] = set()
+        self.links: Set[Tuple[str, str]] = set()
 
     def ft_check_connection(self, value: str) -> None:
         """Check the connection part
@@ -29,17 +45,15 @@ class Parser:
         if len(chunks) != 2 or not chunks[0] or not chunks[1]:
             raise ParseError("Invalide Connection link format.")
         n1, n2 = chunks
-        if (n1 not in self.game.all_names()) \
-                or (n2 not in self.game.all_names()):
+        if n1 not in self.names or n2 not in self.names:
             raise ParseError("Unknown name Link.")
 
-        k1 = f"{n1}-{n2}"
-        k2 = f"{n2}-{n1}"
-
-        if k1 in self.game.net or k2 in self.game.net:
+        edge = (n1, n2) if n1 <= n2 else (n2, n1)
+        if edge in self.links:
             raise ValueError("Duplicated network")
         meta_data = self.ft_parse_meta(meta, 'connection')
-        self.game.net[k1] = Net(n1, n2, meta_data)
+        self.game.add_net(Net(n1, n2, meta_data))
+        self.links.add(edge)
 
     def ft_parse_meta(self, meta_d: Optional[str], parent: str) -> Metadata:
         """parse meta data [zone='4 types' color=None ]
@@ -133,24 +147,21 @@ class Parser:
         if meta == "":
             meta = None
 
-        if name in self.game.all_hubs():
+        if name in self.names:
             raise ValidationError("Duplicate Hub name.")
 
-        if (x, y) in self.game.all_coords():
+        if (x, y) in self.coords:
             raise ValidationError(f"Duplicated coor({x},{y})")
         meta_data: Metadata = self.ft_parse_meta(meta, key)
         hub: Hub = Hub(name, x, y, meta_data)
 
-        if key == "start_hub":
-            if self.game.s_hub:
-                raise ValidationError("Multiple start hub.")
-            self.game.s_hub = hub
-        elif key == "end_hub":
-            if self.game.e_hub:
-                raise ValidationError("Multiple end hub.")
-            self.game.e_hub = hub
-        else:
-            self.game.hubs[name] = hub
+        if key == "start_hub" and self.game.s_hub:
+            raise ValidationError("Multiple start hub.")
+        if key == "end_hub" and self.game.e_hub:
+            raise ValidationError("Multiple end hub.")
+        self.game.add_hub(hub, key)
+        self.names.add(name)
+        self.coords.add((x, y))
 
     def ft_check_drones(self, val: str) -> None:
         """Check number of drones
@@ -202,6 +213,47 @@ class Parser:
         elif key == "connection":
             self.ft_check_connection(value)
 
+    def ft_parse_line(self, i: int, line: Union[str, bytes]) -> None:
+        """Parse one line of the map
+
+        Args:
+            i: line number (for the error message)
+            line: raw line, str or bytes (utf-8)
+        """
+        if isinstance(line, bytes):
+            line = line.decode()
+        value = line.strip()
+
+        if value.startswith("#") or value == "":
+            return
+        if '#' in value:
+            value = value.split('#', 1)[0].strip()
+        if ":" not in value:
+            raise ParseError(f"Line {i}: Invalide Structure.")
+        try:
+            key, val = value.split(":", 1)
+            key = key.strip()
+            val = val.strip()
+            self.ft_valide_key(key)
+            self.ft_valide_value(key, val)
+        except (ValueError, ParseError, ValidationError) as e:
+            raise ValidationError(f"Line {i}: Error:{e}")
+
+    def ft_parse_lines(self, lines: Iterable[Union[str, bytes]]) -> Game:
+        """Parse a map from any iterable of lines in a single pass
+        (open file, sys.stdin, iter(mmap.readline, b""), list...)
+
+        Return:
+            the checked game
+        """
+        for i, line in enumerate(lines, 1):
+            self.ft_parse_line(i, line)
+        self.game.ensure_index()
+        if not self.game.check_game():
+            raise ValueError(
+                    "ERROR: Check map file start or end is Missing.")
+        return self.game
+
     def ft_parse(self) -> Game:
         """Check if the path file is valide
         Args:
@@ -211,28 +263,7 @@ class Parser:
         Return:
             game dict contains key and values
         """
-        if self.filename.endswith(".txt"):
-            with open(self.filename, "r") as f:
-                for i, line in enumerate(f, 1):
-                    value = line.strip()
-
-                    if value.startswith("#") or value == "":
-                        continue
-                    if '#' in value:
-                        value = value.split('#', 1)[0].strip()
-                    if ":" not in value:
-                        raise ParseError(f"Line {i}: Invalide Structure.")
-                    try:
-                        key, val = value.split(":", 1)
-                        key = key.strip()
-                        val = val.strip()
-                        self.ft_valide_key(key)
-                        self.ft_valide_value(key, val)
-                    except (ValueError, ParseError, ValidationError) as e:
-                        raise ValidationError(f"Line {i}: Error:{e}")
-            if not self.game.check_game():
-                raise ValueError(
-                        "ERROR: Check map file start or end is Missing.")
-        else:
+        if not self.filename.endswith(".txt"):
             raise ValueError("Invalide file")
-        return self.game
+        with open(self.filename, "r") as f:
+            return self.ft_parse_lines(f)
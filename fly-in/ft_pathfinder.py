@@ -1,24 +1,56 @@
 from models import Zone, Hub, Game, Net
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Set, Tuple
+from math import sqrt
+import heapq
 
 
 class Pathfinder:
     """A* star pathfinder rout """
 
-    def __init__(self, game: Game) -> None:
-        """ get started with data of the environ"""
+    COSTS: Dict[Zone, float] = {
+            Zone.normal: 1,
+            Zone.priority: 0.8,
+            Zone.restricted: 2,
+            Zone.blocked: float('inf')
+            }
+    MIN_COST: float = 0.8
+    EPS: float = 1e-9
+    # a repair that touches more than that share of the tree gives up
+    REPAIR_SHARE: float = 0.5
+    MAX_BACKOFF: int = 64
+
+    def __init__(self, game: Game, use_heuristic: bool = False) -> None:
+        """ get started with data of the environ
+
+        Args:
+            game: parsed map
+            use_heuristic: guide the search with heuristic(), same cost
+                but equal cost paths may be picked in another order
+        """
         self.game = game
+        self.use_heuristic = use_heuristic
+        self.last_expanded: int = 0
+        self.nb_expanded: int = 0
+        self.nb_searches: int = 0
+        self._max_link: float = 0
+        self._nb_links: int = -1
+        self.dist: Dict[str, float] = {}
+        self.nb_trees: int = 0
+        self.nb_repairs: int = 0
+        self._tree_end: Optional[str] = None
+        self._tree_dirty: bool = True
+        # incremental repair of the tree (LPA*, see repair())
+        self._rhs: Dict[str, float] = {}
+        self._queue: List[Tuple[float, int, str]] = []
+        self._pushes: int = 0
+        self._changed: Dict[Tuple[str, str], Net] = {}
+        self._skip: int = 0
+        self._backoff: int = 1
 
     @staticmethod
     def move_cost(hub: Hub, net: Net) -> float:
         """Return the cost of the Hub"""
-        costs = {
-                Zone.normal: 1,
-                Zone.priority: 0.8,
-                Zone.restricted: 2,
-                Zone.blocked: float('inf')
-                }
-        base = costs.get(hub.meta.zone, float('inf'))
+        base = Pathfinder.COSTS.get(hub.meta.zone, float('inf'))
         if base == float('inf'):
             return base
 
@@ -29,6 +61,32 @@ class Pathfinder:
             base += 0.01
         return base
 
+    def max_link(self) -> float:
+        """Longest connection of the map (coordinates units)"""
+        if self._nb_links != len(self.game.net):
+            hubs = self.game.all_hubs()
+            longest = 0.0
+            for net in self.game.net.values():
+                h1 = hubs[net.name1]
+                h2 = hubs[net.name2]
+                longest = max(longest, sqrt(
+                    (h1.x - h2.x) ** 2 + (h1.y - h2.y) ** 2))
+            self._max_link = longest
+            self._nb_links = len(self.game.net)
+        return self._max_link
+
+    def heuristic(self, hub: Hub, end: Hub) -> float:
+        """Euclidean estimate of the cost left from hub to end.
+        One move covers at most max_link() units and costs at least
+        MIN_COST so the estimate never overshoots (admissible)"""
+        if not self.use_heuristic:
+            return 0
+        longest = self.max_link()
+        if longest == 0:
+            return 0
+        dist = sqrt((hub.x - end.x) ** 2 + (hub.y - end.y) ** 2)
+        return self.MIN_COST * dist / longest
+
     @staticmethod
     def reconstruct_path(
             came_from: Dict[str, Optional[str]],
@@ -43,35 +101,228 @@ class Pathfinder:
         return path
 
     def A_star(self, start: Hub, end: Hub) -> list[str]:
-        """Find the optimal path (list of Hubs) from start to end"""
-        visited = []
-        open_set = [start.name]
+        """Find the optimal path (list of Hubs) from start to end
+
+        open set is a binary heap of (f, order, name), outdated entries
+        are skipped when poped (lazy deletion)
+        """
+        visited: Set[str] = set()
+        order: Dict[str, int] = {start.name: 0}
+        open_set: List[Tuple[float, int, str]] = [
+                (self.heuristic(start, end), 0, start.name)]
         came_from: Dict[str, Optional[str]] = {start.name: None}
         g_score = {start.name: 0.0}
-        while open_set:
-            current = min(open_set, key=lambda x: g_score.get(x, float('inf')))
-            open_set.remove(current)
+        expanded = 0
+        self.nb_searches += 1
+        try:
+            while open_set:
+                _, _, current = heapq.heappop(open_set)
+                if current in visited:
+                    continue
 
-            if current == end.name:
-                return self.reconstruct_path(came_from, current)
+                if current == end.name:
+                    return self.reconstruct_path(came_from, current)
 
-            visited.append(current)
+                visited.add(current)
+                expanded += 1
 
-            for n, net in self.game.get_neighbors(current):
+                for n, net in self.game.get_neighbors(current):
 
-                if n.name in visited:
-                    continue
+                    if n.name in visited:
+                        continue
+
+                    if n.meta.zone == Zone.blocked:
+                        continue
+                    cost = self.move_cost(n, net)
+                    new_g_score = g_score[current] + cost
+
+                    if n.name not in g_score or new_g_score < g_score[n.name]:
+
+                        g_score[n.name] = new_g_score
+                        came_from[n.name] = current
+                        if n.name not in order:
+                            order[n.name] = len(order)
+                        heapq.heappush(open_set, (
+                            new_g_score + self.heuristic(n, end),
+                            order[n.name],
+                            n.name))
+            return []
+        finally:
+            self.last_expanded = expanded
+            self.nb_expanded += expanded
 
-                if n.meta.zone == Zone.blocked:
+    def invalidate(self) -> None:
+        """Everything may have changed (reset), rebuild the tree"""
+        self._tree_dirty = True
+        self._changed = {}
+
+    def link_changed(self, net: Net) -> None:
+        """A link got full or free: its cost changed, the tree is
+        repaired around it before the next query"""
+        self._changed[(net.name1, net.name2)] = net
+
+    def shortest_tree(self, end: Hub) -> None:
+        """Reverse Dijkstra from end: distance to end of every hub
+
+        Same costs as A_star (entering a hub costs move_cost) so every
+        hub gets its shortest path to end in one search.
+        """
+        dist: Dict[str, float] = {end.name: 0.0}
+        order: Dict[str, int] = {end.name: 0}
+        done: Set[str] = set()
+        open_set: List[Tuple[float, int, str]] = [(0.0, 0, end.name)]
+        hubs = self.game.all_hubs()
+        while open_set:
+            d, _, current = heapq.heappop(open_set)
+            if current in done:
+                continue
+            done.add(current)
+            self.nb_expanded += 1
+            hub = hubs[current]
+            if hub.meta.zone == Zone.blocked:
+                continue
+            for n, net in self.game.get_neighbors(current):
+                if n.name in done:
                     continue
-                cost = self.move_cost(n, net)
-                new_g_score = g_score[current] + cost
+                cost = self.move_cost(hub, net)
+                new_d = d + cost
+                if n.name not in dist or new_d < dist[n.name]:
+                    dist[n.name] = new_d
+                    if n.name not in order:
+                        order[n.name] = len(order)
+                    heapq.heappush(open_set, (new_d, order[n.name], n.name))
+        self.dist = dist
+        self.nb_trees += 1
+        self._tree_end = end.name
+        self._tree_dirty = False
+        self._rhs = {}
+        self._queue = []
+        self._changed = {}
+
+    def best_via(self, name: str) -> float:
+        """One step look-ahead: cheapest cost to end through a neighbor,
+        with the current distances (rhs of LPA*)"""
+        best = float('inf')
+        dist = self.dist
+        for n, net in self.game.get_neighbors(name):
+            if n.name in dist:
+                cost = self.move_cost(n, net) + dist[n.name]
+                if cost < best:
+                    best = cost
+        return best
+
+    def update_hub(self, name: str) -> None:
+        """Recompute the look-ahead of a hub (scan its neighbors)"""
+        if name != self._tree_end:
+            self.set_rhs(name, self.best_via(name))
+
+    def set_rhs(self, name: str, rhs: float) -> None:
+        """New look-ahead of a hub, queue it if its distance is not
+        right anymore"""
+        dist = self.dist.get(name, float('inf'))
+        if rhs == dist:
+            self._rhs.pop(name, None)
+            return
+        self._rhs[name] = rhs
+        self._pushes += 1
+        heapq.heappush(self._queue, (min(rhs, dist), self._pushes, name))
+
+    def repair(self, limit: float = float('inf')) -> bool:
+        """Fix the tree after links changed cost (LPA* with no heuristic,
+        run until every hub is consistent)
+
+        Only hubs whose distance to end depends on a changed link are
+        touched: the work follows the size of the change, not of the map.
+        A hub that gets closer only offers itself to its neighbors, one
+        that gets further only makes the neighbors that went through it
+        look again.
+
+        Return:
+            False if it stopped after `limit` hubs (the tree is then
+            broken, rebuild it)
+        """
+        changed = self._changed
+        self._changed = {}
+        for a, b in changed:
+            self.update_hub(a)
+            self.update_hub(b)
+        hubs = self.game.all_hubs()
+        end = self._tree_end
+        queue = self._queue
+        rhs_of = self._rhs
+        dist_of = self.dist
+        inf = float('inf')
+        expanded = 0
+        while queue:
+            key, _, name = heapq.heappop(queue)
+            if name not in rhs_of:
+                continue
+            rhs = rhs_of[name]
+            dist = dist_of.get(name, inf)
+            if key != min(rhs, dist):
+                continue
+            if expanded >= limit:
+                return False
+            expanded += 1
+            self.nb_expanded += 1
+            hub = hubs[name]
+            if dist > rhs:
+                dist_of[name] = rhs
+                del rhs_of[name]
+                for n, net in self.game.get_neighbors(name):
+                    if n.name == end:
+                        continue
+                    via = self.move_cost(hub, net) + rhs
+                    if via < rhs_of.get(n.name, dist_of.get(n.name, inf)):
+                        self.set_rhs(n.name, via)
+            else:
+                del dist_of[name]
+                self.update_hub(name)
+                for n, net in self.game.get_neighbors(name):
+                    if n.name == end:
+                        continue
+                    via = self.move_cost(hub, net) + dist
+                    if via == rhs_of.get(n.name, dist_of.get(n.name, inf)):
+                        self.update_hub(n.name)
+        self.nb_repairs += 1
+        return True
 
-                if n.name not in g_score or new_g_score < g_score[n.name]:
+    def refresh(self, end: Hub) -> None:
+        """Repair the tree, or rebuild it when repairs keep touching most
+        of it (small or very connected maps): after a repair gives up,
+        the next 1, 2, 4... changes rebuild before a repair is tried
+        again"""
+        if self._skip:
+            self._skip -= 1
+            self.shortest_tree(end)
+        elif self.repair(self.REPAIR_SHARE * len(self.dist)):
+            self._backoff = 1
+        else:
+            self._skip = self._backoff
+            self._backoff = min(self._backoff * 2, self.MAX_BACKOFF)
+            self.shortest_tree(end)
 
-                    g_score[n.name] = new_g_score
-                    # + self.heuristic(n, end)
-                    came_from[n.name] = current
-                    if n.name not in open_set:
-                        open_set.append(n.name)
-        return []
+    def next_hop(self, start: Hub, end: Hub) -> Optional[str]:
+        """Next hub on a shortest path from start to end (None if there
+        is no path), the tree is only rebuilt after invalidate() and
+        repaired after link_changed().
+        When several neighbors are on a shortest path, take the first one
+        that still has room for a drone"""
+        if self._tree_dirty or self._tree_end != end.name:
+            self.shortest_tree(end)
+        elif self._changed:
+            self.refresh(end)
+        if start.name not in self.dist:
+            return None
+        best: Optional[str] = None
+        for n, net in self.game.get_neighbors(start.name):
+            if n.name not in self.dist:
+                continue
+            cost = self.move_cost(n, net) + self.dist[n.name]
+            if abs(cost - self.dist[start.name]) > self.EPS:
+                continue
+            if n.occupancy() < n.meta.max_drones and net.can_use():
+                return n.name
+            if best is None:
+                best = n.name
+        return best
@@ -0,0 +1,251 @@
+""" Pre-flight analysis of fly-in maps: reject bad maps before a Sim """
+import argparse
+import hashlib
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Set
+
+from errors import FlyInError
+from ft_maps import find_maps
+from ft_parser import Parser
+from ft_scheduler import FlowNetwork, Scheduler
+from models import Game, Zone
+
+
+# bump when analyze() or Report change: older cache files are dropped
+ANALYSIS_VERSION = 1
+
+
+@dataclass
+class Report:
+    """What the analysis found on one map"""
+    map: str = ''
+    hash: str = ''
+    hubs: int = 0
+    links: int = 0
+    drones: int = 0
+    connected: bool = False
+    throughput: int = 0
+    min_turns: int = 0
+    turns_bound: int = 0
+    unreachable: List[str] = field(default_factory=list)
+    dead_ends: List[str] = field(default_factory=list)
+    error: str = ''
+    seconds: float = 0
+
+    @property
+    def ok(self) -> bool:
+        """The map can be flown"""
+        return not self.error and self.connected
+
+
+def reachable(game: Game) -> Set[str]:
+    """Hubs a drone can reach from the start (blocked hubs are walls)"""
+    if game.s_hub is None:
+        return set()
+    hubs = game.all_hubs()
+    seen = {game.s_hub.name}
+    queue = deque(seen)
+    while queue:
+        name = queue.popleft()
+        if hubs[name].meta.zone == Zone.blocked and name != game.s_hub.name:
+            continue
+        for n, _ in game.get_neighbors(name):
+            if n.name not in seen and n.meta.zone != Zone.blocked:
+                seen.add(n.name)
+                queue.append(n.name)
+    return seen
+
+
+def dead_ends(game: Game, seen: Set[str]) -> List[str]:
+    """Reachable hubs in branches that only lead back: peel hubs with
+    one way out (start and end excluded) until none is left"""
+    ends = {hub.name for hub in (game.s_hub, game.e_hub) if hub}
+    degree = {name: sum(1 for n, _ in game.get_neighbors(name)
+                        if n.name in seen)
+              for name in seen}
+    queue = deque(name for name, d in degree.items()
+                  if d <= 1 and name not in ends)
+    peeled: List[str] = []
+    while queue:
+        name = queue.popleft()
+        if degree[name] < 0:
+            continue
+        degree[name] = -1
+        peeled.append(name)
+        for n, _ in game.get_neighbors(name):
+            if degree.get(n.name, -1) < 0:
+                continue
+            degree[n.name] -= 1
+            if degree[n.name] <= 1 and n.name not in ends:
+                queue.append(n.name)
+    return sorted(peeled)
+
+
+def throughput(game: Game, seen: Set[str]) -> int:
+    """Min cut between start and end: at most that many drones reach
+    the end in one turn (hub capacity max_drones, link capacity
+    max_link_capacity, start and end unbounded). Stops at nb_drones:
+    more would not change the turn bound"""
+    if game.s_hub is None or game.e_hub is None:
+        return 0
+    start, end = game.s_hub.name, game.e_hub.name
+    if end not in seen:
+        return 0
+    hubs = game.all_hubs()
+    big = sum(net.meta.max_link_capacity for net in game.net.values())
+    g = FlowNetwork()
+    h_in: Dict[str, int] = {}
+    h_out: Dict[str, int] = {}
+    for name in seen:
+        h_in[name] = g.add_node()
+        h_out[name] = g.add_node()
+        cap = big if name in (start, end) else hubs[name].meta.max_drones
+        g.add_edge(h_in[name], h_out[name], cap)
+    for net in game.net.values():
+        if net.name1 in seen and net.name2 in seen:
+            cap = net.meta.max_link_capacity
+            g.add_edge(h_out[net.name1], h_in[net.name2], cap)
+            g.add_edge(h_out[net.name2], h_in[net.name1], cap)
+    return g.max_flow(h_in[start], h_out[end], max(game.nb_drones, 1))
+
+
+def analyze(game: Game, report: Optional[Report] = None) -> Report:
+    """Connectivity, throughput and turn bounds of a parsed map
+
+    turns_bound = min_turns + ceil(drones / throughput) - 1: the first
+    drone needs min_turns, then at most `throughput` drones land a turn.
+    """
+    report = report or Report()
+    start = time.perf_counter()
+    hubs = game.all_hubs()
+    report.hubs = len(hubs)
+    report.links = len(game.net)
+    report.drones = game.nb_drones
+    if game.s_hub is None or game.e_hub is None:
+        report.error = "Missing start or end hub"
+        return report
+    seen = reachable(game)
+    report.connected = game.e_hub.name in seen
+    report.unreachable = sorted(name for name, hub in hubs.items()
+                                if name not in seen
+                                and hub.meta.zone != Zone.blocked)
+    report.dead_ends = dead_ends(game, seen)
+    if report.connected:
+        report.throughput = throughput(game, seen)
+        report.min_turns = Scheduler(game).min_turns()
+        report.turns_bound = report.min_turns - 1 \
+            + -(-game.nb_drones // max(report.throughput, 1))
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def analyze_file(path: str, digest: str = '') -> Report:
+    """Parse and analyze one map file (parse errors go in the report)
+
+    Args:
+        path: map file
+        digest: sha256 of the file when the caller already has it
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    report = Report(map=path,
+                    hash=digest or hashlib.sha256(data).hexdigest())
+    try:
+        game = Parser(path).ft_parse_lines(data.splitlines())
+        game.widen_ends()
+        analyze(game, report)
+    except (FlyInError, ValueError) as e:
+        report.error = str(e)
+    return report
+
+
+def analyze_all(
+        paths: List[str],
+        cache: Optional[str] = None,
+        workers: Optional[int] = None
+        ) -> List[Report]:
+    """Analyze maps with a pool of processes, skip the maps whose content
+    (sha256) is already in the cache file
+
+    The cache file is {"version": ANALYSIS_VERSION, "reports": {sha256:
+    report}}, a file written by another version is ignored.
+    """
+    known: Dict[str, Dict[str, object]] = {}
+    if cache:
+        try:
+            with open(cache) as f:
+                stored = json.load(f)
+            if stored.get('version') == ANALYSIS_VERSION:
+                known = stored['reports']
+        except (OSError, ValueError, AttributeError, KeyError):
+            known = {}
+    digests = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            digests[path] = hashlib.sha256(f.read()).hexdigest()
+    todo = [p for p in paths if digests[p] not in known]
+    if len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            fresh = list(pool.map(analyze_file, todo,
+                                  [digests[p] for p in todo]))
+    else:
+        fresh = [analyze_file(p, digests[p]) for p in todo]
+    for report in fresh:
+        known[report.hash] = asdict(report)
+    if cache and fresh:
+        with open(cache, 'w') as f:
+            json.dump({'version': ANALYSIS_VERSION, 'reports': known}, f,
+                      indent=1)
+    reports = []
+    for path in paths:
+        report = Report(**known[digests[path]])  # type: ignore[arg-type]
+        report.map = path
+        reports.append(report)
+    return reports
+
+
+def print_report(report: Report) -> None:
+    """Short summary of one map"""
+    if report.error:
+        print(f"{report.map}: KO {report.error}")
+        return
+    if not report.connected:
+        print(f"{report.map}: KO the end cannot be reached")
+        return
+    print(f"{report.map}: {report.hubs} hubs, {report.links} links,"
+          + f" {report.drones} drones | throughput {report.throughput}"
+          + f"/turn, one drone {report.min_turns} turns,"
+          + f" at least {report.turns_bound} turns")
+    for title, names in (('unreachable', report.unreachable),
+                         ('dead ends', report.dead_ends)):
+        if names:
+            more = f" (+{len(names) - 8})" if len(names) > 8 else ''
+            print(f"    {title}: {' '.join(names[:8])}{more}")
+
+
+def main() -> None:
+    """ python ft_preflight.py ../maps --cache .preflight.json """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('maps', nargs='?', default='../maps',
+                        help='map file or folder (searched recursively)')
+    parser.add_argument('--cache', help='json cache keyed by file sha256')
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    paths = find_maps(args.maps)
+    if not paths:
+        sys.exit(f"No map found in {args.maps}")
+    reports = analyze_all(paths, args.cache, args.workers)
+    for report in reports:
+        print_report(report)
+    if not all(report.ok for report in reports):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,410 @@
+""" Global planner: time-expanded max-flow over hubs x turns """
+from collections import deque
+import heapq
+from typing import Callable, Dict, List, Optional, Tuple
+from models import Game, Hub, Net, Zone
+
+
+class FlowNetwork:
+    """Directed graph with capacities, max-flow with Dinic"""
+
+    def __init__(self) -> None:
+        """ empty network (edges i and i ^ 1 are a pair)"""
+        self.adj: List[List[int]] = []
+        self.to: List[int] = []
+        self.cap: List[int] = []
+
+    def add_node(self) -> int:
+        """Add a node and return its id"""
+        self.adj.append([])
+        return len(self.adj) - 1
+
+    def add_edge(self, u: int, v: int, cap: int) -> int:
+        """Add the edge u -> v and return its id"""
+        self.adj[u].append(len(self.to))
+        self.to.append(v)
+        self.cap.append(cap)
+        self.adj[v].append(len(self.to))
+        self.to.append(u)
+        self.cap.append(0)
+        return len(self.to) - 2
+
+    def flow(self, edge: int) -> int:
+        """Flow sent through an edge (capacity of its reverse edge)"""
+        return self.cap[edge ^ 1]
+
+    def _levels(self, s: int, t: int) -> List[int]:
+        """BFS levels of the residual graph"""
+        level = [-1] * len(self.adj)
+        level[s] = 0
+        queue = deque([s])
+        while queue:
+            u = queue.popleft()
+            for e in self.adj[u]:
+                v = self.to[e]
+                if self.cap[e] > 0 and level[v] < 0:
+                    level[v] = level[u] + 1
+                    queue.append(v)
+        return level
+
+    def _augment(
+            self,
+            s: int,
+            t: int,
+            level: List[int],
+            it: List[int],
+            limit: int
+            ) -> int:
+        """Find one augmenting path in the level graph (iterative DFS)"""
+        stack: List[int] = []
+        u = s
+        while True:
+            if u == t:
+                pushed = min([limit] + [self.cap[e] for e in stack])
+                for e in stack:
+                    self.cap[e] -= pushed
+                    self.cap[e ^ 1] += pushed
+                return pushed
+            while it[u] < len(self.adj[u]):
+                e = self.adj[u][it[u]]
+                v = self.to[e]
+                if self.cap[e] > 0 and level[v] == level[u] + 1:
+                    break
+                it[u] += 1
+            if it[u] < len(self.adj[u]):
+                e = self.adj[u][it[u]]
+                stack.append(e)
+                u = self.to[e]
+                continue
+            if not stack:
+                return 0
+            level[u] = -1
+            e = stack.pop()
+            u = self.to[e ^ 1]
+            it[u] += 1
+
+    def max_flow(self, s: int, t: int, limit: int) -> int:
+        """Push up to limit units from s to t"""
+        total = 0
+        while total < limit:
+            level = self._levels(s, t)
+            if level[t] < 0:
+                break
+            it = [0] * len(self.adj)
+            while total < limit:
+                pushed = self._augment(s, t, level, it, limit - total)
+                if not pushed:
+                    break
+                total += pushed
+        return total
+
+
+class Scheduler:
+    """Plan every drone at once over a time-expanded graph
+
+    A node (hub, t) is the hub at the end of turn t, its capacity is
+    max_drones. A connection used during turn t is a node of capacity
+    max_link_capacity shared by both directions. Entering a restricted
+    hub goes through the middle of the connection and lands one turn
+    later. The second turn on the connection is not counted by the flow,
+    so the flow gives a lower bound on the number of turns; the drones
+    then follow the flow routes with the exact rules (schedule()).
+    """
+
+    def __init__(self, game: Game) -> None:
+        """ get the map we plan on """
+        if game.s_hub is None or game.e_hub is None:
+            raise ValueError("Missing start or end hub")
+        self.game = game
+        self.start: Hub = game.s_hub
+        self.end: Hub = game.e_hub
+        self.hubs = game.all_hubs()
+        self.to_end: Dict[str, int] = {}
+        self.bound: int = 0
+        self.turns: int = 0
+
+    def capacity(self, hub: Hub) -> int:
+        """Max drones of a hub (start and end take the whole fleet)"""
+        if hub is self.start or hub is self.end:
+            return max(hub.meta.max_drones, self.game.nb_drones)
+        return hub.meta.max_drones
+
+    def usable(self, hub: Hub) -> bool:
+        """ hub a drone can be in """
+        return hub.meta.zone != Zone.blocked or hub is self.start
+
+    def step(self, hub: Hub) -> int:
+        """Turns to enter a hub"""
+        return 2 if hub.meta.zone == Zone.restricted else 1
+
+    def turns_to_end(self) -> Dict[str, int]:
+        """Turns from every hub to the end for one drone alone"""
+        if self.to_end:
+            return self.to_end
+        best: Dict[str, int] = {self.end.name: 0}
+        heap: List[Tuple[int, str]] = [(0, self.end.name)]
+        while heap:
+            d, cur = heapq.heappop(heap)
+            if d > best[cur]:
+                continue
+            hub = self.hubs[cur]
+            if not self.usable(hub):
+                continue
+            for n, _ in self.game.get_neighbors(cur):
+                cost = d + self.step(hub)
+                if n.name not in best or cost < best[n.name]:
+                    best[n.name] = cost
+                    heapq.heappush(heap, (cost, n.name))
+        self.to_end = best
+        return best
+
+    def min_turns(self) -> int:
+        """Turns for one drone alone, 0 if the end is not reachable"""
+        return self.turns_to_end().get(self.start.name, 0)
+
+    def build(self, turns: int, n: int) -> Tuple[
+            FlowNetwork, int, int, Dict[int, Tuple[str, int]]]:
+        """Time-expanded network for n drones and a number of turns
+
+        Return:
+            network, source, sink and the nodes a drone enters a hub or
+            the middle of a connection by (id -> hub it leads to, t)
+        """
+        g = FlowNetwork()
+        src = g.add_node()
+        sink = g.add_node()
+        h_in: Dict[Tuple[str, int], int] = {}
+        h_out: Dict[Tuple[str, int], int] = {}
+        entry: Dict[int, Tuple[str, int]] = {}
+        for name, hub in self.hubs.items():
+            if not self.usable(hub):
+                continue
+            cap = self.capacity(hub)
+            if hub is self.start or hub is self.end:
+                cap = max(cap, n)
+            for t in range(turns + 1):
+                h_in[(name, t)] = g.add_node()
+                h_out[(name, t)] = g.add_node()
+                entry[h_in[(name, t)]] = (name, t)
+                g.add_edge(h_in[(name, t)], h_out[(name, t)], cap)
+                if t:
+                    g.add_edge(h_out[(name, t - 1)], h_in[(name, t)], n)
+        g.add_edge(src, h_in[(self.start.name, 0)], n)
+        g.add_edge(h_out[(self.end.name, turns)], sink, n)
+
+        for net in self.game.net.values():
+            a = self.hubs[net.name1]
+            b = self.hubs[net.name2]
+            if not self.usable(a) or not self.usable(b):
+                continue
+            for t in range(1, turns + 1):
+                l_in = g.add_node()
+                l_out = g.add_node()
+                g.add_edge(l_in, l_out, net.meta.max_link_capacity)
+                for src_hub, dst_hub in ((a, b), (b, a)):
+                    if src_hub is not self.end:
+                        g.add_edge(h_out[(src_hub.name, t - 1)], l_in, n)
+                    if dst_hub.meta.zone != Zone.restricted:
+                        g.add_edge(l_out, h_in[(dst_hub.name, t)], n)
+                    elif t < turns:
+                        mid = g.add_node()
+                        entry[mid] = (dst_hub.name, t + 1)
+                        g.add_edge(l_out, mid, n)
+                        g.add_edge(mid, h_in[(dst_hub.name, t + 1)], n)
+        return g, src, sink, entry
+
+    def max_drones(self, turns: int) -> int:
+        """How many drones the flow can deliver in the given turns"""
+        n = self.game.nb_drones
+        g, src, sink, _ = self.build(turns, n)
+        return g.max_flow(src, sink, n)
+
+    def lower_bound(self) -> int:
+        """Smallest number of turns the flow accepts (0 if no path)"""
+        low = self.min_turns()
+        if low == 0:
+            return 0
+        n = self.game.nb_drones
+        high = low
+        while self.max_drones(high) < n:
+            low = high + 1
+            high *= 2
+        while low < high:
+            mid = (low + high) // 2
+            if self.max_drones(mid) >= n:
+                high = mid
+            else:
+                low = mid + 1
+        return high
+
+    def routes(self, turns: int) -> List[List[str]]:
+        """Split the flow into hub routes, earliest arrival first.
+        The network is filled with as many drones as it takes, so every
+        corridor the flow can use shows up in the routes"""
+        n = self.game.nb_drones * (turns + 1)
+        g, src, sink, entry = self.build(turns, n)
+        total = g.max_flow(src, sink, n)
+        used: Dict[int, int] = {}
+        for e in range(0, len(g.to), 2):
+            if g.flow(e) > 0:
+                used[e] = g.flow(e)
+        res: List[Tuple[int, List[str]]] = []
+        for _ in range(total):
+            route: List[str] = []
+            arrival = turns
+            u = src
+            while u != sink:
+                nxt = [e for e in g.adj[u] if used.get(e, 0) > 0]
+                if not nxt:
+                    break
+                e = self.pick(nxt, g, entry, route)
+                used[e] -= 1
+                u = g.to[e]
+                if u in entry and (not route or route[-1] != entry[u][0]):
+                    route.append(entry[u][0])
+                    if entry[u][0] == self.end.name:
+                        arrival = entry[u][1]
+            if route and route[-1] == self.end.name:
+                res.append((arrival, route))
+        res.sort(key=lambda item: item[0])
+        return [route for _, route in res[:self.game.nb_drones]]
+
+    @staticmethod
+    def pick(
+            edges: List[int],
+            g: FlowNetwork,
+            entry: Dict[int, Tuple[str, int]],
+            route: List[str]
+            ) -> int:
+        """Next edge of a drone: leaving a connection, go to the far hub
+        rather than back to the hub it came from"""
+        for e in edges:
+            v = g.to[e]
+            if v in entry and route and entry[v][0] != route[-1]:
+                return e
+        return edges[0]
+
+    def route_turns(self, route: List[str]) -> int:
+        """Turns a drone alone needs to fly a route"""
+        return sum(self.step(self.hubs[name]) for name in route[1:])
+
+    def descend(self, name: str) -> List[str]:
+        """A shortest route (in turns) from a hub to the end"""
+        to_end = self.turns_to_end()
+        route = [name]
+        while name != self.end.name:
+            for n, _ in self.game.get_neighbors(name):
+                if n.name in to_end and self.usable(n) and \
+                        self.step(n) + to_end[n.name] == to_end[name]:
+                    name = n.name
+                    break
+            else:
+                break
+            route.append(name)
+        return route
+
+    def detour(
+            self,
+            route: List[str],
+            pos: int,
+            is_free: Callable[[Hub, Hub], bool]
+            ) -> Optional[List[str]]:
+        """Drone blocked at route[pos]: another free next hub that does
+        not make the route longer (None if there is none)"""
+        to_end = self.turns_to_end()
+        here = route[pos]
+        left = self.route_turns(route[pos:])
+        for n, _ in self.game.get_neighbors(here):
+            if n.name == route[pos + 1] or n.name not in to_end \
+                    or not self.usable(n):
+                continue
+            if self.step(n) + to_end[n.name] > left:
+                continue
+            if is_free(self.hubs[here], n):
+                return route[:pos + 1] + self.descend(n.name)
+        return None
+
+    def schedule(self, routes: List[List[str]]) -> Optional[List[List[str]]]:
+        """Move the drones along their routes turn by turn with the exact
+        rules, first route first. A blocked drone may take a detour that
+        is not longer. Return the stops of every drone for every turn
+        (hub name, or connection name while in the middle)"""
+        routes = [list(route) for route in routes]
+        occ: Dict[str, int] = {name: 0 for name in self.hubs}
+        occ[self.start.name] = len(routes)
+        pos = [0] * len(routes)
+        stops: List[List[str]] = [[self.start.name] for _ in routes]
+        landing: Dict[int, Net] = {}
+        usage: Dict[str, int] = {}
+
+        def is_free(here: Hub, there: Hub) -> bool:
+            net = self.game.get_network(here, there)
+            return net is not None \
+                and usage.get(net.get_name(), 0) < net.meta.max_link_capacity \
+                and occ[there.name] < self.capacity(there)
+
+        while any(pos[i] < len(r) - 1 for i, r in enumerate(routes)):
+            usage.clear()
+            moved = set()
+            for i, link in landing.items():
+                usage[link.get_name()] = usage.get(link.get_name(), 0) + 1
+                pos[i] += 1
+                moved.add(i)
+            landing = {}
+            progress = True
+            while progress:
+                progress = False
+                for i, route in enumerate(routes):
+                    if i in moved or pos[i] >= len(route) - 1:
+                        continue
+                    here = self.hubs[route[pos[i]]]
+                    there = self.hubs[route[pos[i] + 1]]
+                    if not is_free(here, there):
+                        other = self.detour(route, pos[i], is_free)
+                        if other is None:
+                            continue
+                        routes[i] = route = other
+                        there = self.hubs[route[pos[i] + 1]]
+                    net = self.game.get_network(here, there)
+                    if net is None:
+                        return None
+                    key = net.get_name()
+                    usage[key] = usage.get(key, 0) + 1
+                    occ[here.name] -= 1
+                    occ[there.name] += 1
+                    moved.add(i)
+                    progress = True
+                    if there.meta.zone == Zone.restricted:
+                        landing[i] = net
+                    else:
+                        pos[i] += 1
+            if not moved:
+                return None
+            for i, route in enumerate(routes):
+                if i in landing:
+                    stops[i].append(landing[i].get_name())
+                else:
+                    stops[i].append(route[pos[i]])
+        return stops
+
+    def solve(self, tries: int = 4) -> Optional[Dict[int, List[str]]]:
+        """Full plan: drone idx -> stop of every turn (None if no plan).
+        Routes of the flow at the bound and a few turns above it are
+        scheduled, the shortest schedule is kept"""
+        self.bound = self.lower_bound()
+        if self.bound == 0:
+            return None
+        best: Optional[List[List[str]]] = None
+        for turns in range(self.bound, self.bound + tries):
+            routes = self.routes(turns)
+            if len(routes) != self.game.nb_drones:
+                continue
+            stops = self.schedule(routes)
+            if stops and (best is None or len(stops[0]) < len(best[0])):
+                best = stops
+            if best and len(best[0]) - 1 == self.bound:
+                break
+        if best is None:
+            return None
+        self.turns = len(best[0]) - 1
+        return {i + 1: item for i, item in enumerate(best)}
@@ -1,29 +1,83 @@
 from models import Game, Drone, Hub, Zone, Net
-from typing import List, Union, Optional
+from typing import Dict, List, Optional
+from dataclasses import dataclass, field
+from ft_motion import Motion
 from ft_pathfinder import Pathfinder
-from math import sqrt
+from ft_scheduler import Scheduler
+from ft_trace import Trace
+from time import perf_counter
 from errors import ValidationError
 
 
+@dataclass
+class RunResult:
+    """What a headless run gives back"""
+    turns: int = 0
+    done: bool = False
+    seconds: float = 0
+    moves: List[List[str]] = field(default_factory=list)
+
+
 class Sim:
     """ where Fly-in start after parsing """
 
-    def __init__(self, game: Game) -> None:
-        """ get game Object and Path """
+    def __init__(
+            self,
+            game: Game,
+            planner: str = 'greedy',
+            source: Optional[Trace] = None
+            ) -> None:
+        """ get game Object and Path
+
+        Args:
+            game: parsed map
+            planner: 'greedy' routes drone by drone every turn,
+                'flow' replays the schedule of the Scheduler,
+                'replay' replays the moves of `source` (no pathfinding)
+            source: recorded run for the 'replay' planner
+        """
         self.game = game
         self.pathfinder = Pathfinder(self.game)
         self.drones: List[Drone] = []
+        self.held: List[Optional[Hub]] = []
+        self.motion = Motion(0, 0, 0, 0)
+        self.landed: int = 0
         self.turns: int = 0
+        self.plan: Optional[Dict[int, List[str]]] = None
+        self.bound: int = 0
+        self.verbose: bool = True
+        self.moves: List[List[str]] = []
+        self.turn_moves: List[str] = []
+        self.trace = Trace(self.game.nb_drones)
+        self.source: Optional[Trace] = None
         if self.game.s_hub is None or self.game.e_hub is None:
             raise ValidationError("Missing start or end hub")
         self.ft_setup_drones()
+        if planner == 'replay':
+            if source is None:
+                raise ValueError("The replay planner needs a trace")
+            if source.nb_drones != self.game.nb_drones:
+                raise ValidationError(
+                        f"ERROR: the trace has {source.nb_drones} drones,"
+                        + f" the map {self.game.nb_drones}.")
+            self.source = source
+            return
         if self.pathfinder.A_star(self.game.s_hub, self.game.e_hub) == []:
             raise ValidationError("ERROR: There is No path.")
+        if planner == 'flow':
+            scheduler = Scheduler(self.game)
+            self.plan = scheduler.solve()
+            self.bound = scheduler.bound
+            if self.plan is None:
+                raise ValidationError("ERROR: flow planner found no plan.")
+        elif planner != 'greedy':
+            raise ValueError(f"Unknown planner: {planner}")
 
     def ft_setup_drones(self) -> List[Drone]:
         """Set up the drones that we need to update later"""
         if self.game.s_hub is None:
             raise ValueError("Missing start hub")
+        self.held = [None] * (self.game.nb_drones + 1)
         for i in range(self.game.nb_drones):
             self.drones.append(Drone(
                 idx=i + 1,
@@ -31,57 +85,64 @@ class Sim:
                 y=self.game.s_hub.y,
                 path=None,
                 hub_name=self.game.s_hub.name))
-            self.game.s_hub.drones.append(f'D-{self.drones[i].idx}')
+            self.ft_occupy(self.game.s_hub, self.drones[i])
+        speed = self.drones[0].speed if self.drones else 0
+        self.motion = Motion(len(self.drones), self.game.s_hub.x,
+                             self.game.s_hub.y, speed)
+        self.landed = 0
         return self.drones
 
-    def ft_update_drone(self, drone: Drone, dt: float) -> None:
-        """Move drone from hub to next one if it's possible"""
-        target: Union[Hub, Net]
-        if not drone.next_hub:
-            return
-        if drone.next_hub in self.game.all_hubs():
-            target = self.game.all_hubs()[drone.next_hub]
-        else:
-            if drone.net is None:
-                return
-            target = drone.net
-
-        dx = target.x - drone.x
-        dy = target.y - drone.y
-        dist = sqrt(dx * dx + dy * dy)
-        dist_step = drone.speed * dt
-        if dist <= dist_step:
-            drone.x = target.x
-            drone.y = target.y
-            if drone.next_hub not in self.game.all_hubs():
-                return
-            target_hub: Hub = self.game.all_hubs()[drone.next_hub]
-            drone.hub_name = target_hub.name
+    def ft_occupy(self, hub: Hub, drone: Drone) -> None:
+        """The drone takes a place in the hub (one hub at most)"""
+        hub.occupy()
+        self.held[drone.idx] = hub
+
+    def ft_leave(self, hub: Hub, drone: Drone) -> bool:
+        """The drone frees its place in the hub (False if it had none)"""
+        if self.held[drone.idx] is not hub:
+            return False
+        hub.leave()
+        self.held[drone.idx] = None
+        return True
+
+    def ft_send(self, drone: Drone) -> None:
+        """Give the motion engine the goal of a drone that just moved:
+        its next hub, or the middle of the link for a restricted one"""
+        hubs = self.game.all_hubs()
+        if drone.next_hub in hubs:
+            hub = hubs[drone.next_hub]
+            self.motion.go(drone.idx - 1, hub.x, hub.y)
+        elif drone.net is not None:
+            self.motion.go(drone.idx - 1, drone.net.x, drone.net.y)
+
+    def ft_update_drones(self, dt: float) -> None:
+        """Move every drone toward its goal in one batch, then land the
+        ones that reached a hub (free the link they used)
+
+        Drone.x/y are written when a drone reaches its goal, the live
+        positions are in self.motion.pos.
+        """
+        hubs = self.game.all_hubs()
+        for row in self.motion.step(dt).tolist():
+            drone = self.drones[row]
+            drone.x, drone.y = self.motion.pos[row].tolist()
+            if drone.next_hub not in hubs:
+                continue
+            drone.hub_name = drone.next_hub
             if drone.net:
-                drone.net.usage -= 1
+                self.ft_change_usage(drone.net, -1)
                 drone.net = None
             drone.next_hub = None
-            return
-
-        vx = (dx / dist) * drone.speed
-        vy = (dy / dist) * drone.speed
-        drone.x += vx * dt
-        drone.y += vy * dt
+            if self.game.e_hub and drone.hub_name == self.game.e_hub.name:
+                self.landed += 1
 
     def all_drones_arrived(self) -> bool:
         """ Check if drones are moving around the map"""
-        for drone in self.drones:
-            if drone.next_hub is not None:
-                if drone.net is None or not drone.was_in(drone.net):
-                    return False
-        return True
+        return not self.motion.busy()
 
     def sim_done(self) -> bool:
         """ check if all drones are in the e_hub"""
-        for drone in self.drones:
-            if self.game.e_hub and drone.hub_name != self.game.e_hub.name:
-                return False
-        return True
+        return self.landed == len(self.drones)
 
     def drone_land(self, drone: Drone) -> bool:
         """ check if the drone lands or still fly in"""
@@ -94,17 +155,88 @@ class Sim:
     def step(self) -> int:
         """Simulation goes here """
         moves = 0
-        for drone in self.drones:
-            if self.drone_land(drone):
-                continue
+        if self.source is not None:
+            moves = self.replay_turn()
+        else:
+            for drone in self.drones:
+                if self.plan is not None:
+                    if self.replay_drone(drone, self.plan[drone.idx]):
+                        moves += 1
+                    continue
+                if self.drone_land(drone):
+                    continue
 
-            if self.plane_drone(drone):
-                moves += 1
+                if self.plane_drone(drone):
+                    moves += 1
         if moves:
-            print()
+            if self.verbose:
+                print()
+            self.moves.append(self.turn_moves)
+            self.turn_moves = []
+            self.trace.end_turn()
             self.turns += 1
         return 1 if moves else 0
 
+    def ft_log_move(self, drone: Drone) -> None:
+        """Record (and print) the move of a drone for this turn"""
+        move = f'D{drone.idx}-{drone.next_hub}'
+        self.turn_moves.append(move)
+        self.trace.add(drone.idx, str(drone.next_hub))
+        if self.verbose:
+            print(f'{move} ', end='')
+
+    def run_to_completion(self, max_turns: int = 0) -> RunResult:
+        """Run turn after turn without drawing nor printing until every
+        drone lands (or nothing can move any more / max_turns)
+
+        Return:
+            turns, moves of every turn, timing and if the run is done
+        """
+        verbose = self.verbose
+        self.verbose = False
+        start = perf_counter()
+        try:
+            if not max_turns:
+                self.fast_forward()
+            elif self.turns < max_turns:
+                self.fast_forward(max_turns - self.turns)
+        finally:
+            self.verbose = verbose
+        return RunResult(
+                turns=self.turns,
+                done=self.sim_done(),
+                seconds=perf_counter() - start,
+                moves=self.moves)
+
+    def fast_forward(self, turns: int = 0) -> int:
+        """Play whole turns at once, no animation: drones in flight land
+        right away (until every drone lands, nothing can move any more
+        or `turns` turns were played, 0: no limit)
+
+        Return:
+            number of turns played
+        """
+        start = self.turns
+        idle = 0
+        while not self.sim_done() and idle < 2:
+            if turns and self.turns - start >= turns:
+                break
+            self.ft_update_drones(float('inf'))
+            idle = 0 if self.step() else idle + 1
+        return self.turns - start
+
+    def seek(self, turn: int) -> None:
+        """Go to the start of a turn: start again and play the turns
+        before it at once (cheap with the 'replay' planner)"""
+        verbose = self.verbose
+        self.verbose = False
+        try:
+            self.reset()
+            if turn > 0:
+                self.fast_forward(turn)
+        finally:
+            self.verbose = verbose
+
     def plane_drone(self, drone: Drone) -> bool:
         """ Compute the path of a drone from it's xand y to the end"""
 
@@ -114,7 +246,8 @@ class Sim:
         end_p: Hub = self.game.e_hub
 
         if drone.next_hub is None:
-            drone.path = self.pathfinder.A_star(origine, end_p)
+            hop = self.pathfinder.next_hop(origine, end_p)
+            drone.path = [origine.name, hop] if hop else []
         if drone.path is None or len(drone.path) <= 1:
             return False
         target: Hub = self.game.all_hubs()[drone.path[1]]
@@ -125,51 +258,133 @@ class Sim:
 
         drone.net = net
         net.stay_in(origine, target)
-        """
-        if len(target.drones) >= target.meta.max_drones and\
-                target.meta.zone == Zone.restricted:
-            if drone.was_in(net):
-                target.drones.remove(f'D-{drone.idx}')
-        """
-
-        if len(target.drones) >= target.meta.max_drones and drone.was_in(net):
-            target.drones.remove(f'D-{drone.idx}')
+        full = target.occupancy() >= target.meta.max_drones
+        if full and drone.was_in(net):
+            self.ft_leave(target, drone)
 
-        if len(target.drones) >= target.meta.max_drones \
-                and not drone.was_in(net):
+        if full and not drone.was_in(net):
             drone.path = None
             drone.next_hub = None
             return False
 
-        if target.meta.zone == Zone.restricted and not drone.was_in(net):
+        entering = target.meta.zone == Zone.restricted \
+            and not drone.was_in(net)
+        if entering:
             drone.next_hub = net.get_name()
-            target.drones.append(f'D-{drone.idx}')
         else:
             drone.next_hub = drone.path[1]
             drone.path.pop(0)
             if origine.meta.zone == Zone.restricted:
-                net.usage -= 2
+                self.ft_change_usage(net, -2)
         if not drone.was_in(net):
-            net.reserve()
-        if f'D-{drone.idx}' in origine.drones:
-            origine.drones.remove(f'D-{drone.idx}')
-        if target.meta.zone != Zone.restricted:
-            target.drones.append(f'D-{drone.idx}')
+            self.ft_change_usage(net, 1)
+        # leave before taking the new place: a drone holds one hub at most
+        self.ft_leave(origine, drone)
+        if entering or target.meta.zone != Zone.restricted:
+            self.ft_occupy(target, drone)
 
         drone.visited.append(origine.name)
-        print(f'D{drone.idx}-{drone.next_hub} ', end='')
+        self.ft_send(drone)
+        self.ft_log_move(drone)
 
         return True
 
+    def replay_drone(self, drone: Drone, stops: List[str]) -> bool:
+        """Move a drone as the flow plan says for this turn"""
+        if self.turns + 1 >= len(stops):
+            return False
+        here = stops[self.turns]
+        there = stops[self.turns + 1]
+        if here == there:
+            return False
+        hubs = self.game.all_hubs()
+        target = None
+        if here in hubs:
+            target = hubs[there] if there in hubs \
+                else hubs[stops[self.turns + 2]]
+        self.ft_replay_move(drone, here, there, target)
+        return True
+
+    def replay_turn(self) -> int:
+        """Play the moves the source trace recorded for this turn
+
+        Return:
+            number of moves
+        """
+        if self.source is None or self.turns >= self.source.nb_turns:
+            return 0
+        hubs = self.game.all_hubs()
+        moves = self.source.turn(self.turns)
+        for idx, there in moves:
+            if not 0 < idx <= len(self.drones):
+                raise ValidationError(f"Unknown drone D{idx} in the trace")
+            drone = self.drones[idx - 1]
+            here = drone.next_hub or drone.hub_name or ''
+            target = None
+            if here in hubs and there in hubs:
+                target = hubs[there]
+            elif here in hubs:
+                net = self.game.net.get(there)
+                if net is None or here not in (net.name1, net.name2):
+                    raise ValidationError(
+                            f"D{idx} cannot go from {here} to {there}")
+                target = hubs[net.name2 if net.name1 == here
+                              else net.name1]
+            self.ft_replay_move(drone, here, there, target)
+        return len(moves)
+
+    def ft_replay_move(
+            self,
+            drone: Drone,
+            here: str,
+            there: str,
+            target: Optional[Hub]
+            ) -> None:
+        """Move a drone from here to there as it is told
+
+        Args:
+            target: hub at the end of the link taken when here is a hub,
+                None when the drone lands from a link
+        """
+        hubs = self.game.all_hubs()
+        if target is not None:
+            origine = hubs[here]
+            net = self.game.get_network(origine, target)
+            if net is None:
+                raise ValidationError(f"No link {origine.name}-{target.name}")
+            drone.net = net
+            net.stay_in(origine, target)
+            self.ft_change_usage(net, 1)
+            if not self.ft_leave(origine, drone):
+                raise ValidationError(
+                        f"D{drone.idx} is not in {origine.name}")
+            self.ft_occupy(target, drone)
+            drone.visited.append(origine.name)
+        drone.next_hub = there
+        self.ft_send(drone)
+        self.ft_log_move(drone)
+
+    def ft_change_usage(self, net: Net, delta: int) -> None:
+        """Reserve (delta > 0) or release a link, the shared path tree
+        is repaired only when the link switches between full and free"""
+        was_free = net.can_use()
+        if delta > 0:
+            net.reserve()
+        else:
+            net.usage += delta
+        if net.can_use() != was_free:
+            self.pathfinder.link_changed(net)
+
     def reset(self) -> None:
         """ reset the simulation back to where we start"""
-        for hub in self.game.all_hubs().values():
-            hub.drones.clear()
-
-        for net in self.game.net.values():
-            net.usage = 0
+        self.game.clear_traffic()
+        self.pathfinder.invalidate()
 
         self.drones.clear()
         self.turns = 0
+        self.moves = []
+        self.turn_moves = []
+        self.trace = Trace(self.game.nb_drones)
         self.ft_setup_drones()
-        print('<-----------------Again------------------->')
+        if self.verbose:
+            print('<-----------------Again------------------->')
@@ -0,0 +1,248 @@
+""" Spatial index of the map: what is in a window, and clusters of hubs """
+import math
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from models import Game, Hub, Net
+
+
+class Level:
+    """Clusters of one level of detail
+
+    A cluster is a cell of 2**k x 2**k base cells holding hubs, drawn at
+    the mean position of its hubs. Two clusters are linked when some
+    link of the map goes from one to the other.
+    """
+    __slots__ = ('k', 'x', 'y', 'count', 'edge_a', 'edge_b', 'edge_count')
+
+    def __init__(self, k: int) -> None:
+        self.k = k
+        self.x: Any = np.empty(0)
+        self.y: Any = np.empty(0)
+        self.count: Any = np.empty(0, dtype=np.int64)
+        self.edge_a: Any = np.empty(0, dtype=np.int64)
+        self.edge_b: Any = np.empty(0, dtype=np.int64)
+        self.edge_count: Any = np.empty(0, dtype=np.int64)
+
+
+class SpatialIndex:
+    """Uniform grid over the hubs and the bounding boxes of the links
+
+    The grid has side x side cells over the bounding box of the map,
+    about `per_cell` hubs in a cell. A link is put in every cell its
+    bounding box covers, unless that box spans more than `long_cells`
+    cells: it is then kept aside and clipped against every window.
+
+    Hubs and links are numbered in the order of game.all_hubs() and
+    game.net, queries give the ids back in that order so the drawing
+    order stays the same.
+    """
+
+    def __init__(
+            self,
+            game: Game,
+            per_cell: int = 4,
+            long_cells: int = 64
+            ) -> None:
+        """ index every hub and link of the game """
+        self.hubs: List[Hub] = list(game.all_hubs().values())
+        self.nets: List[Net] = list(game.net.values())
+        ids = {hub.name: i for i, hub in enumerate(self.hubs)}
+        self.xs: Any = np.array([h.x for h in self.hubs], dtype=float)
+        self.ys: Any = np.array([h.y for h in self.hubs], dtype=float)
+        self.link_a: Any = np.array([ids[n.name1] for n in self.nets],
+                                    dtype=np.int64)
+        self.link_b: Any = np.array([ids[n.name2] for n in self.nets],
+                                    dtype=np.int64)
+
+        self.side = max(1, int(math.sqrt(len(self.hubs) / per_cell)))
+        self.min_x = float(self.xs.min()) if len(self.hubs) else 0.0
+        self.min_y = float(self.ys.min()) if len(self.hubs) else 0.0
+        span_x = float(self.xs.max()) - self.min_x if len(self.hubs) else 0
+        span_y = float(self.ys.max()) - self.min_y if len(self.hubs) else 0
+        self.cell_w = (span_x or 1.0) / self.side
+        self.cell_h = (span_y or 1.0) / self.side
+
+        cx = self.cell_x(self.xs)
+        cy = self.cell_y(self.ys)
+        self.hub_cells = self.group(cy * self.side + cx)
+
+        self.link_cells: Dict[int, List[int]] = {}
+        long_links: List[int] = []
+        ax, bx = cx[self.link_a], cx[self.link_b]
+        ay, by = cy[self.link_a], cy[self.link_b]
+        x0, x1 = np.minimum(ax, bx).tolist(), np.maximum(ax, bx).tolist()
+        y0, y1 = np.minimum(ay, by).tolist(), np.maximum(ay, by).tolist()
+        for e in range(len(self.nets)):
+            if (x1[e] - x0[e] + 1) * (y1[e] - y0[e] + 1) > long_cells:
+                long_links.append(e)
+                continue
+            for gy in range(y0[e], y1[e] + 1):
+                for gx in range(x0[e], x1[e] + 1):
+                    self.link_cells.setdefault(
+                            gy * self.side + gx, []).append(e)
+        self.long_links: Any = np.array(long_links, dtype=np.int64)
+        ends_x = (self.xs[self.link_a[self.long_links]],
+                  self.xs[self.link_b[self.long_links]])
+        ends_y = (self.ys[self.link_a[self.long_links]],
+                  self.ys[self.link_b[self.long_links]])
+        self.long_box = (np.minimum(*ends_x), np.maximum(*ends_x),
+                         np.minimum(*ends_y), np.maximum(*ends_y))
+
+        self.levels: List[Level] = []
+        k = 0
+        while True:
+            self.levels.append(self.build_level(k, cx >> k, cy >> k))
+            if self.side >> k <= 1:
+                break
+            k += 1
+
+    def cell_x(self, x: Any) -> Any:
+        """Grid column of x (array or number)"""
+        col = np.floor((np.asarray(x) - self.min_x) / self.cell_w)
+        return np.clip(col, 0, self.side - 1).astype(np.int64)
+
+    def cell_y(self, y: Any) -> Any:
+        """Grid row of y (array or number)"""
+        row = np.floor((np.asarray(y) - self.min_y) / self.cell_h)
+        return np.clip(row, 0, self.side - 1).astype(np.int64)
+
+    @staticmethod
+    def group(keys: Any) -> Dict[int, Any]:
+        """Ids of the items by key (ids stay sorted in a key)"""
+        order = np.argsort(keys, kind='stable')
+        uniq, starts = np.unique(keys[order], return_index=True)
+        return dict(zip(uniq.tolist(), np.split(order, starts[1:])))
+
+    def build_level(self, k: int, cx: Any, cy: Any) -> Level:
+        """Clusters of the cells of 2**k base cells"""
+        level = Level(k)
+        if not len(self.hubs):
+            return level
+        uniq, inv, count = np.unique(cy * self.side + cx,
+                                     return_inverse=True, return_counts=True)
+        level.count = count
+        level.x = np.bincount(inv, weights=self.xs) / count
+        level.y = np.bincount(inv, weights=self.ys) / count
+        a, b = inv[self.link_a], inv[self.link_b]
+        cross = a != b
+        lo = np.minimum(a, b)[cross]
+        hi = np.maximum(a, b)[cross]
+        pairs, level.edge_count = np.unique(lo * len(uniq) + hi,
+                                            return_counts=True)
+        level.edge_a = pairs // len(uniq)
+        level.edge_b = pairs % len(uniq)
+        return level
+
+    def cells(
+            self,
+            x0: float,
+            x1: float,
+            y0: float,
+            y1: float
+            ) -> List[int]:
+        """Keys of the cells that meet the window [x0, x1] x [y0, y1]"""
+        c0, c1 = self.cell_x([x0, x1]).tolist()
+        r0, r1 = self.cell_y([y0, y1]).tolist()
+        return [r * self.side + c
+                for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)]
+
+    def hubs_in(
+            self,
+            x0: float,
+            x1: float,
+            y0: float,
+            y1: float
+            ) -> Any:
+        """Ids of the hubs inside the window, sorted"""
+        cells = self.hub_cells
+        found = [cells[key] for key in self.cells(x0, x1, y0, y1)
+                 if key in cells]
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        ids = np.sort(np.concatenate(found))
+        xs, ys = self.xs[ids], self.ys[ids]
+        return ids[(xs >= x0) & (xs <= x1) & (ys >= y0) & (ys <= y1)]
+
+    def links_in(
+            self,
+            x0: float,
+            x1: float,
+            y0: float,
+            y1: float
+            ) -> List[int]:
+        """Ids of the links whose bounding box meets the window (long
+        links: that cross it), sorted"""
+        cells = self.link_cells
+        lx0, lx1, ly0, ly1 = self.long_box
+        near = self.long_links[(lx0 <= x1) & (lx1 >= x0)
+                               & (ly0 <= y1) & (ly1 >= y0)]
+        found = set(self.crossing(near, x0, x1, y0, y1).tolist())
+        for key in self.cells(x0, x1, y0, y1):
+            if key in cells:
+                found.update(cells[key])
+        return sorted(found)
+
+    def crossing(
+            self,
+            links: Any,
+            x0: float,
+            x1: float,
+            y0: float,
+            y1: float
+            ) -> Any:
+        """The links (ids) whose segment crosses the window
+        (Liang-Barsky clipping, all links at once)"""
+        ax, ay = self.xs[self.link_a[links]], self.ys[self.link_a[links]]
+        dx = self.xs[self.link_b[links]] - ax
+        dy = self.ys[self.link_b[links]] - ay
+        t0 = np.zeros(len(links))
+        t1 = np.ones(len(links))
+        keep = np.ones(len(links), dtype=bool)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for p, q in ((-dx, ax - x0), (dx, x1 - ax),
+                         (-dy, ay - y0), (dy, y1 - ay)):
+                keep &= (p != 0) | (q >= 0)
+                t = q / p
+                t0 = np.where(p < 0, np.maximum(t0, t), t0)
+                t1 = np.where(p > 0, np.minimum(t1, t), t1)
+        return links[keep & (t0 <= t1)]
+
+    def level_for(self, px_w: float, px_h: float, size: int) -> Level:
+        """Finest level whose cells are at least `size` pixels wide
+
+        Args:
+            px_w: screen pixels per map unit in x
+            px_h: screen pixels per map unit in y
+            size: smallest cluster cell on screen
+        """
+        for level in self.levels:
+            scale = 1 << level.k
+            if min(self.cell_w * px_w, self.cell_h * px_h) * scale >= size:
+                return level
+        return self.levels[-1]
+
+    def clusters_in(
+            self,
+            level: Level,
+            x0: float,
+            x1: float,
+            y0: float,
+            y1: float
+            ) -> Tuple[Any, Any]:
+        """Visible clusters of a level, and the cluster links that
+        touch at least one of them
+
+        Return:
+            (cluster ids, cluster link ids)
+        """
+        seen = (level.x >= x0) & (level.x <= x1) \
+            & (level.y >= y0) & (level.y <= y1)
+        edges = np.flatnonzero(seen[level.edge_a] | seen[level.edge_b])
+        return np.flatnonzero(seen), edges
+
+    @staticmethod
+    def heaviest(ids: Any, weights: Any, nb: int) -> Any:
+        """The nb ids of largest weight (all if fewer), sorted"""
+        if len(ids) <= nb:
+            return ids
+        return np.sort(ids[np.argpartition(-weights[ids], nb)[:nb]])
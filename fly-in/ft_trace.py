@@ -0,0 +1,197 @@
+""" Binary trace of a run: every move of every turn, in columns
+
+Destinations (hubs, and links for restricted transits) are interned to
+int ids. A move is two uint32 (drone idx, destination id), the moves of
+turn t are rows index[t] to index[t + 1].
+
+File layout (little endian):
+    magic 'FLYTRACE', version, nb_drones, nb_names, nb_turns, nb_moves
+    names       nb_names x (uint16 length + utf-8 bytes)
+    index       (nb_turns + 1) x uint32
+    drone       nb_moves x uint32
+    dest        nb_moves x uint32
+
+Header, names and index are read at load, so a turn can be read alone
+(seek) without loading the moves of the whole run.
+"""
+import argparse
+import struct
+import sys
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from errors import ValidationError
+
+MAGIC = b'FLYTRACE'
+VERSION = 1
+HEADER = struct.Struct('<8s5I')
+Move = Tuple[int, str]
+
+
+def to_bytes(column: "array[int]") -> bytes:
+    """Column in little endian"""
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def from_bytes(data: bytes) -> "array[int]":
+    """uint32 column from little endian bytes"""
+    column = array('I', data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+class Trace:
+    """Moves of a run turn by turn (record, save, load, seek)"""
+
+    def __init__(self, nb_drones: int = 0) -> None:
+        """ empty trace, turn 0 open """
+        self.nb_drones = nb_drones
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.index = array('I', [0])
+        self.drone = array('I')
+        self.dest = array('I')
+        # moves left on disk (see load(lazy=True))
+        self.path: Optional[str] = None
+        self.moves_at = 0
+        self.nb_moves = 0
+
+    @property
+    def nb_turns(self) -> int:
+        """Closed turns"""
+        return len(self.index) - 1
+
+    def intern(self, name: str) -> int:
+        """Id of a destination name (new id the first time)"""
+        key = self.ids.get(name)
+        if key is None:
+            key = len(self.names)
+            self.ids[name] = key
+            self.names.append(name)
+        return key
+
+    def add(self, drone: int, dest: str) -> None:
+        """Record a move of the current turn"""
+        self.drone.append(drone)
+        self.dest.append(self.intern(dest))
+        self.nb_moves += 1
+
+    def end_turn(self) -> None:
+        """Close the current turn"""
+        self.index.append(len(self.drone))
+
+    def turn(self, t: int) -> List[Move]:
+        """Moves of turn t (0 based) as (drone idx, destination)"""
+        if not 0 <= t < self.nb_turns:
+            raise IndexError(f"No turn {t} in a {self.nb_turns} turns trace")
+        start, end = self.index[t], self.index[t + 1]
+        if self.path is None:
+            drones = self.drone[start:end]
+            dests = self.dest[start:end]
+        else:
+            with open(self.path, 'rb') as f:
+                f.seek(self.moves_at + 4 * start)
+                drones = from_bytes(f.read(4 * (end - start)))
+                f.seek(self.moves_at + 4 * (self.nb_moves + start))
+                dests = from_bytes(f.read(4 * (end - start)))
+        names = self.names
+        return [(d, names[n]) for d, n in zip(drones, dests)]
+
+    def lines(self) -> Iterator[str]:
+        """The run as printed by the simulation, one line per turn"""
+        for t in range(self.nb_turns):
+            yield ' '.join(f'D{d}-{name}' for d, name in self.turn(t))
+
+    def first_difference(self, other: 'Trace') -> int:
+        """First turn where the two runs differ (-1: same runs)"""
+        for t in range(min(self.nb_turns, other.nb_turns)):
+            if sorted(self.turn(t)) != sorted(other.turn(t)):
+                return t
+        if self.nb_turns != other.nb_turns:
+            return min(self.nb_turns, other.nb_turns)
+        return -1
+
+    def save(self, path: str) -> None:
+        """Write the trace file"""
+        if self.path is not None:
+            raise ValueError("load the trace with lazy=False to save it")
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.nb_drones,
+                                len(self.names), self.nb_turns,
+                                len(self.drone)))
+            for name in self.names:
+                raw = name.encode()
+                f.write(struct.pack('<H', len(raw)) + raw)
+            f.write(to_bytes(self.index))
+            f.write(to_bytes(self.drone))
+            f.write(to_bytes(self.dest))
+
+    @classmethod
+    def load(cls, path: str, lazy: bool = False) -> 'Trace':
+        """Read a trace file
+
+        Args:
+            lazy: keep the moves on disk, turn() reads them on demand
+        """
+        trace = cls()
+        with open(path, 'rb') as f:
+            head = f.read(HEADER.size)
+            if len(head) != HEADER.size or head[:8] != MAGIC:
+                raise ValidationError(f"{path}: not a fly-in trace")
+            _, version, trace.nb_drones, nb_names, nb_turns, nb_moves = \
+                HEADER.unpack(head)
+            if version != VERSION:
+                raise ValidationError(
+                        f"{path}: trace version {version} not supported")
+            for _ in range(nb_names):
+                size, = struct.unpack('<H', f.read(2))
+                trace.intern(f.read(size).decode())
+            trace.index = from_bytes(f.read(4 * (nb_turns + 1)))
+            trace.nb_moves = nb_moves
+            if lazy:
+                trace.path = path
+                trace.moves_at = f.tell()
+            else:
+                trace.drone = from_bytes(f.read(4 * nb_moves))
+                trace.dest = from_bytes(f.read(4 * nb_moves))
+        if len(trace.index) != nb_turns + 1 or trace.index[-1] != nb_moves \
+                or (not lazy and len(trace.dest) != nb_moves):
+            raise ValidationError(f"{path}: truncated trace")
+        return trace
+
+
+def main() -> None:
+    """ python ft_trace.py run.trace [other.trace] [--turn T] """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('trace')
+    parser.add_argument('other', nargs='?',
+                        help='compare with this trace')
+    parser.add_argument('--turn', type=int, help='print only that turn')
+    args = parser.parse_args()
+
+    trace = Trace.load(args.trace, lazy=True)
+    if args.other:
+        turn = trace.first_difference(Trace.load(args.other, lazy=True))
+        if turn < 0:
+            print(f"same runs ({trace.nb_turns} turns)")
+            return
+        print(f"runs differ at turn {turn + 1}")
+        for path, run in ((args.trace, trace),
+                          (args.other, Trace.load(args.other, lazy=True))):
+            moves = run.turn(turn) if turn < run.nb_turns else []
+            print(f"{path}: " + ' '.join(f'D{d}-{n}' for d, n in moves))
+        sys.exit(1)
+    if args.turn is not None:
+        print(' '.join(f'D{d}-{n}' for d, n in trace.turn(args.turn - 1)))
+        return
+    for line in trace.lines():
+        print(line)
+    print(f"Turns: {trace.nb_turns}")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,14 +7,26 @@ except ModuleNotFoundError:
     print("Usage: make install")
     sys.exit(1)
 
+import math
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
 from models import Zone, Drone, Hub
 from ft_config import Config
 from ft_sim import Sim
+from ft_spatial import Level, SpatialIndex
 
 
 class Viewer:
     """Window of the Fly-in visualization see the world"""
 
+    PAN_KEYS: Dict[int, Tuple[int, int]] = {
+            pygame.K_LEFT: (1, 0),
+            pygame.K_RIGHT: (-1, 0),
+            pygame.K_UP: (0, 1),
+            pygame.K_DOWN: (0, -1),
+            }
+
     def __init__(self, sim: Sim, config: Config) -> None:
         """Creating the window of fly-in"""
         self.sim = sim
@@ -22,7 +34,14 @@ class Viewer:
         self.cfg = config
         self.running = True
         self.clock = pygame.time.Clock()
-        self.dt = self.clock.tick(60) / 1000.0
+        self.dt = self.cfg.SIM_DT
+        self.lag = 0.0
+        self.speed = 1.0
+        self.undrawn = 0
+        self.dropped = 0.0
+        self.tps = 0.0
+        self.rate_at = time.perf_counter()
+        self.rate_turns = 0
 
         self.paused = not True
         self.steps = False
@@ -34,7 +53,7 @@ class Viewer:
 
         self.screen: pygame.Surface = pygame.display.set_mode((
             self.cfg.WIDTH,
-            self.cfg.HEIGHT))
+            self.cfg.HEIGHT), pygame.RESIZABLE)
         pygame.display.set_caption("Fly-in Visualizer")
 
         self.msg_font = pygame.font.SysFont(None, 38)
@@ -42,13 +61,90 @@ class Viewer:
         self.drone_font = pygame.font.SysFont(None, 15)
         self.header_font = pygame.font.SysFont(None, 64)
 
+        self.texts: Dict[Tuple[int, str, Tuple[int, int, int]],
+                         pygame.Surface] = {}
+        self.background = pygame.Surface((self.cfg.WIDTH, self.cfg.HEIGHT))
+        self.dirty: List[pygame.Rect] = []
+        self.lit: Set[str] = set()
+        self.lit_background = self.background
+        self.index = SpatialIndex(self.game)
+        self.view = self.cfg.view(self.cfg.VIEW_MARGIN)
+        self.view_moved = False
+        self.build_background()
+
+    def ft_text(
+            self,
+            font: pygame.font.Font,
+            text: str,
+            color: Tuple[int, int, int]
+            ) -> pygame.Surface:
+        """Render a text once, then reuse the surface"""
+        key = (id(font), text, color)
+        surf = self.texts.get(key)
+        if surf is None:
+            if len(self.texts) > 4096:
+                self.texts.clear()
+            surf = font.render(text, True, color)
+            self.texts[key] = surf
+        return surf
+
+    def build_background(self) -> None:
+        """Draw the static map (links, hubs, names, menu, header) once,
+        with every hub empty and with every hub occupied: frames only
+        paste back pieces of these two layers where something changed
+
+        Only what is inside the viewport is drawn. When it holds more
+        than cfg.MAX_HUBS hubs or cfg.MAX_LINKS links, hubs are drawn as
+        clusters instead (both layers are then the same).
+        """
+        screen = self.screen
+        self.view = self.cfg.view(self.cfg.VIEW_MARGIN)
+        self.view_moved = False
+        ids = self.index.hubs_in(*self.view)
+        links: List[int] = []
+        if len(ids) <= self.cfg.MAX_HUBS:
+            links = self.index.links_in(*self.view)
+
+        self.screen = pygame.Surface((self.cfg.WIDTH, self.cfg.HEIGHT))
+        self.screen.fill((30, 30, 30))
+        self.game_menu()
+        header = self.ft_text(
+                self.header_font,
+                f"Number of drones : {self.game.nb_drones}",
+                (0, 191, 255))
+        self.screen.blit(header, (10, 5))
+        if len(ids) > self.cfg.MAX_HUBS or len(links) > self.cfg.MAX_LINKS:
+            self.draw_clusters(self.index.level_for(
+                    *self.cfg.pixels_per_unit(), self.cfg.CLUSTER_PX))
+            self.background = self.lit_background = self.screen
+        else:
+            self.draw_connections(links)
+            self.lit_background = self.screen.copy()
+            self.draw_hubs(False, ids.tolist())
+            self.background = self.screen
+            self.screen = self.lit_background
+            self.draw_hubs(True, ids.tolist())
+        self.screen = screen
+        self.screen.blit(self.background, (0, 0))
+        pygame.display.flip()
+        self.dirty = []
+        self.lit = set()
+
+    def hub_rect(self, hub: Hub) -> pygame.Rect:
+        """Screen area of a hub shape"""
+        x = self.cfg.to_screen_x(hub.x)
+        y = self.cfg.to_screen_y(hub.y)
+        size = max(self.cfg.NODE_RADIUS * 2, self.cfg.RECT_SIZE) + 2
+        return pygame.Rect(x - size // 2, y - size // 2, size, size)
+
     def draw_node(
             self,
             hub: Hub,
             x: int,
             y: int,
             color: tuple[int, int, int],
-            b_color: tuple[int, int, int]
+            b_color: tuple[int, int, int],
+            occupied: bool = False
             ) -> None:
         """Draw a hub with shape + border depending on zone"""
 
@@ -62,7 +158,7 @@ class Viewer:
                 self.cfg.RECT_SIZE
             )
             pygame.draw.rect(self.screen, color, rect)
-            if len(hub.drones) >= 1:
+            if occupied:
                 pygame.draw.rect(
                         self.screen, b_color, rect, self.cfg.BORDER_WIDTH)
         elif zone == Zone.blocked:
@@ -74,7 +170,7 @@ class Viewer:
                     )
             pygame.draw.rect(self.screen, color, rect)
 
-            if len(hub.drones) >= 1:
+            if occupied:
                 pygame.draw.rect(
                         self.screen, color, rect, self.cfg.BORDER_WIDTH)
             pygame.draw.line(
@@ -99,7 +195,7 @@ class Viewer:
                     (x, y),
                     self.cfg.NODE_RADIUS
                     )
-            if not len(hub.drones) >= 1:
+            if not occupied:
                 pygame.draw.circle(
                         self.screen,
                         b_color,
@@ -107,12 +203,21 @@ class Viewer:
                         self.cfg.NODE_RADIUS,
                         self.cfg.BORDER_WIDTH)
 
-    def draw_hubs(self) -> None:
+    def draw_hubs(
+            self,
+            occupied: bool = False,
+            ids: Optional[List[int]] = None
+            ) -> None:
         """
-        Draw Each Hub with it;s Credentials
+        Draw Each Hub with it;s Credentials (all empty or all occupied)
+
+        Args:
+            ids: hubs of the spatial index to draw (default: all)
         """
-        pr = 0
-        for name, hub in self.game.all_hubs().items():
+        hubs = self.index.hubs
+        for pr in range(len(hubs)) if ids is None else ids:
+            hub = hubs[pr]
+            name = hub.name
             x = self.cfg.to_screen_x(hub.x)
             y = self.cfg.to_screen_y(hub.y)
 
@@ -121,20 +226,25 @@ class Viewer:
                     hub.meta.color)
 
             b_color = self.cfg.get_border_color(hub.meta.zone)
-            self.draw_node(hub, x, y, color, b_color)
+            self.draw_node(hub, x, y, color, b_color, occupied)
 
             nb = hub.meta.max_drones
             offset = -40 if pr % 2 == 0 else 40
             off_y = 8 if pr % 3 == 0 else 0
-            text = self.font.render(f'{name}:{nb}', True, (255, 255, 255))
+            text = self.ft_text(self.font, f'{name}:{nb}', (255, 255, 255))
             self.screen.blit(text, (x - 30, y - offset + off_y))
-            pr += 1
 
-    def draw_connections(self) -> None:
-        """ Draw Connection between hubs depend on max_link """
+    def draw_connections(self, ids: Optional[List[int]] = None) -> None:
+        """ Draw Connection between hubs depend on max_link
+
+        Args:
+            ids: links of the spatial index to draw (default: all)
+        """
         hubs = self.game.all_hubs()
+        nets = self.index.nets
 
-        for net in self.game.net.values():
+        for e in range(len(nets)) if ids is None else ids:
+            net = nets[e]
             h1 = hubs[net.name1]
             h2 = hubs[net.name2]
 
@@ -143,31 +253,90 @@ class Viewer:
             x2 = self.cfg.to_screen_x(h2.x)
             y2 = self.cfg.to_screen_y(h2.y)
 
-            pygame.draw.line(
-                self.screen,
-                self.cfg.get_link_color(net),
-                (x1, y1),
-                (x2, y2),
-                4
-                )
-
-    def display_msg(self, msg: str) -> None:
+            self.ft_line(self.cfg.get_link_color(net), (x1, y1), (x2, y2), 4)
+
+    def ft_line(
+            self,
+            color: Tuple[int, int, int],
+            start: Tuple[int, int],
+            end: Tuple[int, int],
+            width: int
+            ) -> None:
+        """Draw a line cut to the window first (pygame is very slow on
+        wide lines whose ends are far out of the screen when zoomed in)"""
+        area = self.screen.get_rect().inflate(4 * width, 4 * width)
+        seg = area.clipline(start, end)
+        if seg:
+            pygame.draw.line(self.screen, color, seg[0], seg[1], width)
+
+    def draw_clusters(self, level: Level) -> None:
+        """Zoomed out: one disc per cluster of hubs (sized and labelled
+        by its number of hubs), one line per pair of linked clusters,
+        then the start and end hubs on top"""
+        seen, edges = self.index.clusters_in(level, *self.view)
+        edges = self.index.heaviest(
+                edges, level.edge_count, self.cfg.MAX_EDGES)
+        xs = [self.cfg.to_screen_x(x) for x in level.x[seen].tolist()]
+        ys = [self.cfg.to_screen_y(y) for y in level.y[seen].tolist()]
+        where: Dict[int, Tuple[int, int]] = dict(
+                zip(seen.tolist(), zip(xs, ys)))
+        ea = level.edge_a[edges].tolist()
+        eb = level.edge_b[edges].tolist()
+        for a, b, nb in zip(ea, eb, level.edge_count[edges].tolist()):
+            if a not in where:
+                where[a] = (self.cfg.to_screen_x(level.x[a]),
+                            self.cfg.to_screen_y(level.y[a]))
+            if b not in where:
+                where[b] = (self.cfg.to_screen_x(level.x[b]),
+                            self.cfg.to_screen_y(level.y[b]))
+            self.ft_line((180, 180, 180), where[a], where[b],
+                         min(4, 1 + int(math.log2(nb))))
+        color = self.cfg.ZONE_COLORS[Zone.normal]
+        b_color = self.cfg.BORDER_COLORS[Zone.normal]
+        top = self.cfg.CLUSTER_PX // 2
+        for c, nb in zip(seen.tolist(), level.count[seen].tolist()):
+            radius = min(top, 4 + int(2 * math.log2(nb)))
+            pygame.draw.circle(self.screen, color, where[c], radius)
+            pygame.draw.circle(self.screen, b_color, where[c], radius, 2)
+            if nb > 1:
+                text = self.ft_text(self.drone_font, str(nb), (0, 0, 0))
+                x, y = where[c]
+                self.screen.blit(text, (x - text.get_width() // 2,
+                                        y - text.get_height() // 2))
+        for hub in (self.game.s_hub, self.game.e_hub):
+            if hub is not None:
+                self.draw_node(
+                        hub,
+                        self.cfg.to_screen_x(hub.x),
+                        self.cfg.to_screen_y(hub.y),
+                        self.cfg.get_zone_color(hub.meta.zone,
+                                                hub.meta.color),
+                        self.cfg.get_border_color(hub.meta.zone))
+
+    def display_msg(self, msg: str) -> pygame.Rect:
         """ display your msg simply"""
-        msg_r: pygame.Surface = self.msg_font.render(
-                msg, True, (100, 255, 180))
-        self.screen.blit(
+        msg_r: pygame.Surface = self.ft_text(
+                self.msg_font, msg, (100, 255, 180))
+        return self.screen.blit(
                 msg_r,
                 (self.cfg.WIDTH / 2 - 320, self.cfg.HEIGHT - 40))
 
-    def ft_draw_drone(self, drone: Drone) -> None:
-        """Draw a drone shape"""
-        x = self.cfg.to_screen_x(drone.x)
-        y = self.cfg.to_screen_y(drone.y)
-        pygame.draw.circle(self.screen, (255, 255, 255), (int(x), int(y)), 10)
-        nbr = self.drone_font.render(str(drone.idx), True, (0, 0, 0))
+    def ft_draw_drone(
+            self,
+            drone: Drone,
+            pos_x: float,
+            pos_y: float
+            ) -> pygame.Rect:
+        """Draw a drone shape at its live position"""
+        x = self.cfg.to_screen_x(pos_x)
+        y = self.cfg.to_screen_y(pos_y)
+        rect = pygame.draw.circle(
+                self.screen, (255, 255, 255), (int(x), int(y)), 10)
+        nbr = self.ft_text(self.drone_font, str(drone.idx), (0, 0, 0))
         self.screen.blit(
                 nbr,
                 (int(x) - nbr.get_width() / 2, int(y) - nbr.get_height() / 2))
+        return rect
 
     def game_menu(self) -> None:
         """a box menu containe simulation directions"""
@@ -177,6 +346,11 @@ class Viewer:
                 '<p>  pause mode / resume',
                 '<s>  step mode',
                 '<SPACE> next in step mode',
+                f'<n> <b>  {self.cfg.FF_TURNS} turns on / back',
+                '<[> <]> slower / faster',
+                '<wheel> <+> <-> zoom',
+                '<drag> <arrows> pan',
+                '<f>  fit the map',
                 ]
         pad = 10
         line_h = 20
@@ -187,61 +361,154 @@ class Viewer:
         pygame.draw.rect(
                 self.screen, (80, 40, 80), (box_x, box_y, box_w, box_h), 3)
         for i, item in enumerate(keys):
-            txt = self.font.render(item, True, (180, 180, 180))
+            txt = self.ft_text(self.font, item, (180, 180, 180))
             self.screen.blit(txt, (box_x + pad, box_y + pad + i * line_h))
 
     def ft_display_env(self) -> None:
-        """ Display content in the window """
-        self.game_menu()
-        header = self.header_font.render(
-                    f"Number of drones : {self.game.nb_drones}",
-                    True,
-                    (0, 191, 255))
-        turn_calc = self.header_font.render(
+        """ Display content in the window
+
+        The background is pasted back only where the last frame drew
+        (drones, texts, hubs that got empty), then the occupied hubs,
+        the drones and the texts are drawn and only those rectangles
+        are sent to the screen. Drones out of the viewport are skipped.
+        """
+        if self.view_moved:
+            self.build_background()
+        hubs = self.game.all_hubs()
+        lit = {hub.name for hub in self.sim.held if hub is not None}
+        erase = self.dirty + [self.hub_rect(hubs[name])
+                              for name in self.lit - lit]
+        for rect in erase:
+            self.screen.blit(self.background, rect, rect)
+        drawn: List[pygame.Rect] = []
+        for name in lit:
+            rect = self.hub_rect(hubs[name])
+            if name not in self.lit or rect.collidelist(erase) >= 0:
+                self.screen.blit(self.lit_background, rect, rect)
+                drawn.append(rect)
+        self.lit = lit
+
+        turn_calc = self.ft_text(
+                    self.header_font,
                     f"Number of turnes: {self.sim.turns}",
-                    True,
                     (0, 191, 255))
-        self.screen.blit(header, (10, 5))
-        self.screen.blit(turn_calc, (self.cfg.WIDTH - 460, 5))
-        self.draw_connections()
-        self.draw_hubs()
-
-        for drone in self.sim.drones:
-            self.ft_draw_drone(drone)
-            if not self.paused:
-                self.sim.ft_update_drone(drone, self.dt)
+        drawn.append(self.screen.blit(turn_calc, (self.cfg.WIDTH - 460, 5)))
+        rate = self.ft_text(
+                self.font,
+                f"{self.tps:.1f} turns/s   speed x{self.speed:g}"
+                + f"   undrawn ticks: {self.undrawn}"
+                + f"   dropped: {self.dropped:.1f}s",
+                (0, 191, 255))
+        drawn.append(self.screen.blit(rate, (self.cfg.WIDTH - 460, 52)))
 
-        if not self.paused and not self.steps:
-            if self.sim.all_drones_arrived():
-                self.sim.step()
+        pos = self.sim.motion.pos
+        x0, x1, y0, y1 = self.view
+        rows = np.flatnonzero((pos[:, 0] >= x0) & (pos[:, 0] <= x1)
+                              & (pos[:, 1] >= y0) & (pos[:, 1] <= y1))
+        drones = self.sim.drones
+        for row, (x, y) in zip(rows.tolist(), pos[rows].tolist()):
+            drawn.append(self.ft_draw_drone(drones[row], x, y))
 
         if self.paused and not self.steps:
-            self.display_msg("PAUSED MODE (<p> to resume)")
+            msg = self.display_msg("PAUSED MODE (<p> to resume)")
         elif self.steps:
-            self.display_msg(
+            msg = self.display_msg(
                     "STEP MODE (<SPACE> to advance | <s> to exit)")
         elif self.sim.sim_done():
-            self.display_msg(
+            msg = self.display_msg(
                     "Simulation Done all drones arrived successfully in "
                     +
                     f"{self.sim.turns} turn.")
         else:
-            self.display_msg("press <p> to pause <s> to slow down")
-        pygame.display.flip()
-        self.clock.tick(60)
+            msg = self.display_msg("press <p> to pause <s> to slow down")
+        drawn.append(msg)
+        pygame.display.update(erase + drawn)
+        self.dirty = drawn
+
+    def ft_advance(self, elapsed: float) -> None:
+        """Fixed timestep: play as many ticks of self.dt as the elapsed
+        wall time (times the speed) pays for, whatever the frame rate
+
+        A slow frame plays the ticks it owes without drawing them
+        (counted in self.undrawn). Past cfg.MAX_TICKS ticks in one frame
+        the overdue time is dropped (summed in self.dropped, simulated
+        seconds): the simulation then falls behind the wall clock.
+        """
+        if self.paused:
+            self.lag = 0.0
+            return
+        self.lag += elapsed * self.speed
+        ticks = 0
+        while self.lag >= self.dt and ticks < self.cfg.MAX_TICKS:
+            self.lag -= self.dt
+            ticks += 1
+            self.sim.ft_update_drones(self.dt)
+            if not self.steps and self.sim.all_drones_arrived():
+                self.sim.step()
+        if ticks == self.cfg.MAX_TICKS:
+            self.dropped += self.lag
+            self.lag = 0.0
+        if ticks > 1:
+            self.undrawn += ticks - 1
+        self.ft_rate()
+
+    def ft_rate(self) -> None:
+        """Turns per second of wall time, measured every half second"""
+        now = time.perf_counter()
+        if now - self.rate_at >= 0.5:
+            turns = self.sim.turns - self.rate_turns
+            self.tps = max(0, turns) / (now - self.rate_at)
+            self.rate_at = now
+            self.rate_turns = self.sim.turns
+
+    def ft_set_speed(self, factor: float) -> None:
+        """Multiply the simulation speed (bounded by the config)"""
+        self.speed = min(max(self.speed * factor, self.cfg.MIN_SPEED),
+                         self.cfg.MAX_SPEED)
+
+    def ft_move_view(self, event: Any) -> None:
+        """Zoom (wheel, +, -), pan (drag, arrows) and fit (f) the view,
+        the background is redrawn once on the next frame"""
+        cfg = self.cfg
+        center = (cfg.WIDTH / 2, cfg.HEIGHT / 2)
+        if event.type == pygame.MOUSEWHEEL:
+            cfg.zoom_at(*pygame.mouse.get_pos(), cfg.ZOOM_STEP ** event.y)
+        elif event.type == pygame.MOUSEMOTION and any(event.buttons):
+            cfg.pan(*event.rel)
+        elif event.type == pygame.KEYDOWN and event.key in self.PAN_KEYS:
+            dx, dy = self.PAN_KEYS[event.key]
+            cfg.pan(dx * cfg.PAN_STEP, dy * cfg.PAN_STEP)
+        elif event.type == pygame.KEYDOWN and event.key in (
+                pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+            cfg.zoom_at(*center, cfg.ZOOM_STEP)
+        elif event.type == pygame.KEYDOWN and event.key in (
+                pygame.K_MINUS, pygame.K_KP_MINUS):
+            cfg.zoom_at(*center, 1 / cfg.ZOOM_STEP)
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_f:
+            cfg.fit()
+        else:
+            return
+        self.view_moved = True
 
     def run(self) -> None:
         """Run the simulation with pygame"""
 
         while self.running:
-            self.screen.fill((30, 30, 30))
-
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.running = False
+                if event.type == pygame.VIDEORESIZE:
+                    self.cfg.WIDTH, self.cfg.HEIGHT = event.w, event.h
+                    self.screen = pygame.display.set_mode(
+                            (event.w, event.h), pygame.RESIZABLE)
+                    self.build_background()
+                self.ft_move_view(event)
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_r:
                         self.sim.reset()
+                        self.build_background()
+                        self.lag = 0.0
+                        self.rate_turns = 0
                         self.paused = True
                         self.steps = False
                     if event.key == pygame.K_p:
@@ -252,8 +519,19 @@ class Viewer:
                     if event.key == pygame.K_SPACE and self.steps:
                         if self.sim.all_drones_arrived():
                             self.sim.step()
+                    if event.key == pygame.K_n:
+                        self.sim.fast_forward(self.cfg.FF_TURNS)
+                    if event.key == pygame.K_b:
+                        self.sim.seek(
+                                max(0, self.sim.turns - self.cfg.FF_TURNS))
+                        self.rate_turns = self.sim.turns
+                    if event.key == pygame.K_RIGHTBRACKET:
+                        self.ft_set_speed(2)
+                    if event.key == pygame.K_LEFTBRACKET:
+                        self.ft_set_speed(0.5)
                     if event.key == pygame.K_x:
                         self.running = False
+            self.ft_advance(self.clock.tick(self.cfg.FPS) / 1000.0)
             self.ft_display_env()
 
         pygame.quit()
@@ -1,9 +1,8 @@
 import sys
 import os
+from typing import Dict, Set, Tuple
 from ft_parser import Parser
 from errors import ParseError, ValidationError
-from ft_viewer import Viewer
-from ft_config import Config
 from ft_sim import Sim
 
 
@@ -20,36 +19,79 @@ class FlyIn:
         if os.name == 'posix':
             os.system('clear')
 
-    @staticmethod
-    def ft_get_file() -> str:
-        """first check the file format"""
-        if len(sys.argv) != 2:
+    FLAGS = {'--flow', '--headless', '--compact', '--check'}
+    OPTIONS = {'--record', '--replay'}
+
+    @classmethod
+    def ft_get_args(cls) -> Tuple[str, Set[str], Dict[str, str]]:
+        """first check the file format and the options"""
+        files = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+        flags = {arg for arg in sys.argv[1:]
+                 if arg.startswith('--') and '=' not in arg}
+        options = dict(arg.split('=', 1) for arg in sys.argv[1:]
+                       if arg.startswith('--') and '=' in arg)
+        if len(files) != 1 or not flags <= cls.FLAGS \
+                or not set(options) <= cls.OPTIONS:
             raise ValueError(
-                    "Usage: python main.py path_file.txt \n"
-                    +
-                    "or Usage: make file=path_file.txt")
-        filename = sys.argv[1]
+                    "Usage: python main.py path_file.txt"
+                    + " [--flow] [--headless] [--compact] [--check]"
+                    + " [--record=run.trace] [--replay=run.trace]\n"
+                    + "or Usage: make file=path_file.txt"
+                    + " [flags='--flow --headless']")
+        filename = files[0]
         if not filename.endswith('.txt'):
             raise ValueError("File must be a .txt")
-        return filename
+        return filename, flags, options
+
+    @staticmethod
+    def ft_headless(sim: Sim) -> None:
+        """Run the whole simulation without pygame and print the moves"""
+        res = sim.run_to_completion()
+        for moves in res.moves:
+            print(' '.join(moves))
+        if not res.done:
+            raise ValidationError(
+                    f"ERROR: drones stuck after {res.turns} turns.")
+        print(f'Turns: {res.turns} ({res.seconds * 1000:.1f} ms)')
 
     def fly_in(self) -> None:
         """ Starting the Game of fly-in """
         try:
-            filename = self.ft_get_file()
-            parser = Parser(filename)
-            game = parser.ft_parse()
+            filename, flags, options = self.ft_get_args()
+            # no reference to the parser is kept: its duplicate check sets
+            # hold a tuple per hub and link and would outlive the parse
+            if '--compact' in flags:
+                from ft_compact import CompactGame
+                game = Parser(filename, CompactGame()).ft_parse()
+            else:
+                game = Parser(filename).ft_parse()
             if game.s_hub is None or game.e_hub is None:
                 raise ValidationError("Missing start or End")
-            if game.s_hub.meta.max_drones == 1:
-                game.s_hub.meta.max_drones = game.nb_drones
-            if game.e_hub.meta.max_drones == 1:
-                game.e_hub.meta.max_drones = game.nb_drones
-            config = Config(game)
-            sim = Sim(game)
-            viewer = Viewer(sim, config)
-            viewer.run()
-        except (ValueError, ParseError, ValidationError) as e:
+            game.widen_ends()
+            if '--check' in flags:
+                from ft_preflight import analyze, print_report, Report
+                report = analyze(game, Report(map=filename))
+                print_report(report)
+                if not report.ok:
+                    raise ValidationError(
+                            f"ERROR: {filename} cannot be flown.")
+                return
+            if '--replay' in options:
+                from ft_trace import Trace
+                source = Trace.load(options['--replay'], lazy=True)
+                sim = Sim(game, 'replay', source)
+            else:
+                sim = Sim(game, 'flow' if '--flow' in flags else 'greedy')
+            if '--headless' in flags:
+                self.ft_headless(sim)
+            else:
+                from ft_viewer import Viewer
+                from ft_config import Config
+                viewer = Viewer(sim, Config(game))
+                viewer.run()
+            if '--record' in options:
+                sim.trace.save(options['--record'])
+        except (ValueError, ParseError, ValidationError, OSError) as e:
             print(f'{e}')
         except KeyboardInterrupt:
             self.clear_terminal()
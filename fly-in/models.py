@@ -12,7 +12,7 @@ class Zone(Enum):
     priority = 'priority'
 
 
-@dataclass
+@dataclass(slots=True)
 class Metadata:
     """Data about the hub or the connection"""
     zone: Zone = Zone.normal
@@ -31,14 +31,14 @@ class Metadata:
             raise ValidationError("Max_drones must be <postive int>")
 
 
-@dataclass
+@dataclass(slots=True)
 class Hub:
     """ Hub structure name x y metadata"""
     name: str
     x: int
     y: int
     meta: Metadata
-    drones: List[str] = field(default_factory=list)
+    occupied: int = 0
 
     def __post_init__(self) -> None:
         """Validate Hub After creation."""
@@ -49,8 +49,20 @@ class Hub:
         if not isinstance(self.x, int) or not isinstance(self.y, int):
             raise ValidationError("Hub x and y must be integer.")
 
+    def occupancy(self) -> int:
+        """Number of drones in (or heading to) the hub"""
+        return self.occupied
 
-@dataclass
+    def occupy(self) -> None:
+        """A drone takes a place in the hub"""
+        self.occupied += 1
+
+    def leave(self) -> None:
+        """A drone frees its place"""
+        self.occupied -= 1
+
+
+@dataclass(slots=True)
 class Net:
     """ Network structure """
     name1: str
@@ -94,15 +106,89 @@ class Game:
     e_hub: Optional[Hub] = None
     hubs: Dict[str, Hub] = field(default_factory=dict)
     net: Dict[str, Net] = field(default_factory=dict)
+    _hub_index: Dict[str, Hub] = field(
+            default_factory=dict, repr=False, compare=False)
+    _adj: Dict[str, List[Tuple[Hub, Net]]] = field(
+            default_factory=dict, repr=False, compare=False)
+    _links: Dict[Tuple[str, str], Net] = field(
+            default_factory=dict, repr=False, compare=False)
+    # bumped by every change of hubs, net, s_hub or e_hub: the index is
+    # stale when it was built for another generation
+    _generation: int = field(default=0, repr=False, compare=False)
+    _index_generation: int = field(default=-1, repr=False, compare=False)
+
+    def build_index(self) -> None:
+        """Build the hub table and the adjacency index from scratch"""
+        self._hub_index = {}
+        self._adj = {}
+        self._links = {}
+        for hub in self.hubs.values():
+            self.index_hub(hub)
+        for end in (self.s_hub, self.e_hub):
+            if end:
+                self.index_hub(end)
+        for net in self.net.values():
+            self.index_net(net)
+        self._index_generation = self._generation
+
+    def index_hub(self, hub: Hub) -> None:
+        """Register one hub in the index"""
+        self._hub_index[hub.name] = hub
+        self._adj.setdefault(hub.name, [])
+
+    def index_net(self, net: Net) -> None:
+        """Register one connection in the index (both directions)"""
+        h1 = self._hub_index[net.name1]
+        h2 = self._hub_index[net.name2]
+        self._adj[net.name1].append((h2, net))
+        self._adj[net.name2].append((h1, net))
+        self._links[(net.name1, net.name2)] = net
+        self._links[(net.name2, net.name1)] = net
+
+    def add_hub(self, hub: Hub, key: str = 'hub') -> None:
+        """Add a hub (start_hub, end_hub or hub) and keep the index
+        (a hub replacing another one rebuilds it on next use)"""
+        self.ensure_index()
+        replaced = hub.name in self._hub_index
+        if key == 'start_hub':
+            replaced = replaced or self.s_hub is not None
+            self.s_hub = hub
+        elif key == 'end_hub':
+            replaced = replaced or self.e_hub is not None
+            self.e_hub = hub
+        else:
+            self.hubs[hub.name] = hub
+        self._generation += 1
+        if not replaced:
+            self.index_hub(hub)
+            self._index_generation = self._generation
+
+    def add_net(self, net: Net) -> None:
+        """Add a connection and keep the index
+        (a connection replacing another one rebuilds it on next use)"""
+        self.ensure_index()
+        replaced = net.get_name() in self.net
+        self.net[net.get_name()] = net
+        self._generation += 1
+        if not replaced:
+            self.index_net(net)
+            self._index_generation = self._generation
+
+    def invalidate(self) -> None:
+        """Call after changing hubs, net, s_hub or e_hub directly
+        (not through add_hub/add_net): the index is rebuilt on next use"""
+        self._generation += 1
+
+    def ensure_index(self) -> None:
+        """Rebuild the index if the map changed since it was built"""
+        if self._index_generation != self._generation:
+            self.build_index()
 
     def all_hubs(self) -> Dict[str, Hub]:
-        """Return all hubs structure including start and end """
-        res: Dict[str, Hub] = dict(self.hubs)
-        if self.s_hub:
-            res[self.s_hub.name] = self.s_hub
-        if self.e_hub:
-            res[self.e_hub.name] = self.e_hub
-        return res
+        """Return all hubs structure including start and end
+        (shared cached table, do not modify it)"""
+        self.ensure_index()
+        return self._hub_index
 
     def all_names(self) -> Set[str]:
         """All known hub names."""
@@ -137,29 +223,33 @@ class Game:
             return False
         return True
 
+    def clear_traffic(self) -> None:
+        """Empty every hub and free every link"""
+        for hub in self.all_hubs().values():
+            hub.occupied = 0
+        for net in self.net.values():
+            net.usage = 0
+
+    def widen_ends(self) -> None:
+        """Start and end hold the whole fleet unless the map says so"""
+        for hub in (self.s_hub, self.e_hub):
+            if hub and hub.meta.max_drones == 1:
+                hub.meta.max_drones = self.nb_drones
+
     def get_neighbors(self, hub_name: Optional[str]) -> List[Tuple[Hub, Net]]:
-        """ get neighbors of a Hub"""
-        neigbor = []
-        if hub_name not in self.all_names():
+        """ get neighbors of a Hub (shared list, do not modify it)"""
+        self.ensure_index()
+        if hub_name is None or hub_name not in self._adj:
             raise ValueError(f"Unknown hub: {hub_name}")
-        all_hubs = self.all_hubs()
-
-        for item in self.net.values():
-            if item.name1 == hub_name:
-                neigbor.append((all_hubs[item.name2], item))
-            elif item.name2 == hub_name:
-                neigbor.append((all_hubs[item.name1], item))
-        return neigbor
+        return self._adj[hub_name]
 
     def get_network(self, origine: Hub, target: Hub) -> Optional[Net]:
         """Get network of the link between origine and target"""
-        for ne, net in self.get_neighbors(origine.name):
-            if ne.name == target.name:
-                return net
-        return None
+        self.ensure_index()
+        return self._links.get((origine.name, target.name))
 
 
-@dataclass
+@dataclass(slots=True)
 class Drone:
     """Drone sculter"""
     idx: int